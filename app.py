@@ -1,9 +1,8 @@
 import streamlit as st
-import pymongo
-from pymongo import MongoClient
-import bcrypt
 from datetime import datetime
 import time
+from data_utils.db import find_login_user, get_users_collection
+from data_utils.auth import AuthBusy, verify_password
 
 # 页面配置
 st.set_page_config(
@@ -12,30 +11,22 @@ st.set_page_config(
     layout="centered"
 )
 
-# MongoDB 连接（与注册页保持一致）
-@st.cache_resource
-def init_connection():
-    return MongoClient(st.secrets["mongo"]["conn_str"])  # 与注册页连接信息一致
-
-client = init_connection()
-db = client["user_db"]  # 与注册页数据库名称一致
-users_collection = db["users"]  # 与注册页集合名称一致
-
-# 密码验证（与注册时的加密对应）
-def verify_password(password, hashed_password):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+# MongoDB 连接（与其他页面共用同一个客户端和 users 集合）
+users_collection = get_users_collection(st.secrets["mongo"]["conn_str"])
 
 # 登录逻辑
 def authenticate_user(username, password):
     # 支持用用户名或邮箱登录
-    user = users_collection.find_one({"$or": [
-        {"username": username},
-        {"email": username}
-    ]})
+    user = find_login_user(users_collection, username)
     
     if not user:
         return False, "用户名或密码不正确"
-    if not verify_password(password, user["password"]):
+    # 密码验证（与注册时的加密对应），在后台线程池中进行并按账号/IP限流
+    try:
+        verified = verify_password(password, user["password"], username=user["username"], ip=st.context.ip_address)
+    except AuthBusy as e:
+        return False, str(e)
+    if not verified:
         return False, "用户名或密码不正确"
     if not user.get("is_active", True):
         return False, "账号已被禁用，请联系管理员"
@@ -1,13 +1,17 @@
 #-*- coding:utf-8 -*-    --------------Ashare 股票行情数据双核心版( https://github.com/mpquant/Ashare ) 
-import json,requests,datetime;      import pandas as pd  #
+import json,datetime;      import pandas as pd  #
+from data_utils.net import http_get                                        #长连接复用、超时、重试与熔断
+from data_utils.trading_calendar import default_calendar                   #沪深交易日历(含节假日)
+from data_utils.providers import ProviderRegistry                           #按健康评分选择数据源，慢请求对冲
+PROVIDER_RETRIES=0                                                          #以下接口都经注册表调用：失败由注册表立即切换备用源，不在http_get内退避重试
 
 #腾讯日线
 def get_price_day_tx(code, end_date='', count=10, frequency='1d'):     #日线获取  
     unit='week' if frequency in '1w' else 'month' if frequency in '1M' else 'day'     #判断日线，周线，月线
     if end_date:  end_date=end_date.strftime('%Y-%m-%d') if isinstance(end_date,datetime.date) else end_date.split(' ')[0]
-    end_date='' if end_date==datetime.datetime.now().strftime('%Y-%m-%d') else end_date   #如果日期今天就变成空    
+    end_date='' if end_date and default_calendar().bars_between(datetime.date.fromisoformat(end_date),None,'1d')==0 else end_date   #结束日之后没有新交易日(今天/休市/未来)就变成空
     URL=f'http://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={code},{unit},,{end_date},{count},qfq'     
-    st= json.loads(requests.get(URL).content);    ms='qfq'+unit;      stk=st['data'][code]   
+    st= json.loads(http_get(URL,retries=PROVIDER_RETRIES).content);    ms='qfq'+unit;      stk=st['data'][code]   
     buf=stk[ms] if ms in stk else stk[unit]       #指数返回不是qfqday,是day
     df=pd.DataFrame(buf,columns=['time','open','close','high','low','volume'],dtype='float')     
     df.time=pd.to_datetime(df.time);    df.set_index(['time'], inplace=True);   df.index.name=''          #处理索引 
@@ -18,7 +22,7 @@ def get_price_min_tx(code, end_date=None, count=10, frequency='1d'):    #分钟
     ts=int(frequency[:-1]) if frequency[:-1].isdigit() else 1           #解析K线周期数
     if end_date: end_date=end_date.strftime('%Y-%m-%d') if isinstance(end_date,datetime.date) else end_date.split(' ')[0]        
     URL=f'http://ifzq.gtimg.cn/appstock/app/kline/mkline?param={code},m{ts},,{count}' 
-    st= json.loads(requests.get(URL).content);       buf=st['data'][code]['m'+str(ts)] 
+    st= json.loads(http_get(URL,retries=PROVIDER_RETRIES).content);       buf=st['data'][code]['m'+str(ts)] 
     df=pd.DataFrame(buf,columns=['time','open','close','high','low','volume','n1','n2'])   
     df=df[['time','open','close','high','low','volume']]    
     df[['open','close','high','low','volume']]=df[['open','close','high','low','volume']].astype('float')
@@ -33,11 +37,11 @@ def get_price_sina(code, end_date='', count=10, frequency='60m'):    #新浪全
     ts=int(frequency[:-1]) if frequency[:-1].isdigit() else 1       #解析K线周期数
     if (end_date!='') & (frequency in ['240m','1200m','7200m']): 
         end_date=pd.to_datetime(end_date) if not isinstance(end_date,datetime.date) else end_date    #转换成datetime
-        unit=4 if frequency=='1200m' else 29 if frequency=='7200m' else 1    #4,29多几个数据不影响速度
-        count=count+(datetime.datetime.now()-end_date).days//unit            #结束时间到今天有多少天自然日(肯定 >交易日)        
+        unit='1w' if frequency=='1200m' else '1M' if frequency=='7200m' else '1d'
+        count=count+default_calendar().bars_between(end_date,None,unit)     #结束时间到今天按交易日历精确计算新增K线数
         #print(code,end_date,count)    
     URL=f'http://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData?symbol={code}&scale={ts}&ma=5&datalen={count}' 
-    dstr= json.loads(requests.get(URL).content);       
+    dstr= json.loads(http_get(URL,retries=PROVIDER_RETRIES).content);       
     #df=pd.DataFrame(dstr,columns=['day','open','high','low','close','volume'],dtype='float') 
     df= pd.DataFrame(dstr,columns=['day','open','high','low','close','volume'])
     df['open'] = df['open'].astype(float); df['high'] = df['high'].astype(float);                          #转换数据类型
@@ -46,18 +50,56 @@ def get_price_sina(code, end_date='', count=10, frequency='60m'):    #新浪全
     if (end_date!='') & (frequency in ['240m','1200m','7200m']): return df[df.index<=end_date][-mcount:]   #日线带结束时间先返回              
     return df
 
-def get_price(code, end_date='',count=10, frequency='1d', fields=[]):        #对外暴露只有唯一函数，这样对用户才是最友好的  
+#实时行情，腾讯/新浪均支持多个代码逗号分隔一次请求   返回 price最新价 prev_close昨收 time行情时间 volume成交量(股)
+def get_realtime_quotes_tx(codes):                                          #腾讯实时行情
+    URL='http://qt.gtimg.cn/q='+','.join(codes);      rows=[]
+    for line in http_get(URL,retries=PROVIDER_RETRIES).content.decode('gbk').split(';'):
+        if '="' not in line: continue
+        k,v=line.strip().split('="',1);    f=v.rstrip('"').split('~')
+        if len(f)<31: continue                                              #无效代码返回 v_pv_none_match="1"
+        rows.append([k[2:],float(f[3]),float(f[4]),pd.to_datetime(f[30],format='%Y%m%d%H%M%S'),float(f[6])*100])   #成交量单位 手->股
+    return pd.DataFrame(rows,columns=['code','price','prev_close','time','volume']).set_index('code')
+
+def get_realtime_quotes_sina(codes):                                        #新浪实时行情，需带Referer
+    URL='http://hq.sinajs.cn/list='+','.join(codes);  rows=[]
+    text=http_get(URL,headers={'Referer':'https://finance.sina.com.cn'},retries=PROVIDER_RETRIES).content.decode('gbk')
+    for line in text.split(';'):
+        if '="' not in line: continue
+        k,v=line.strip().split('="',1);    f=v.rstrip('"').split(',')
+        if len(f)<32: continue                                              #无效代码返回空字符串
+        rows.append([k.split('_')[-1],float(f[3]),float(f[2]),pd.to_datetime(f[30]+' '+f[31]),float(f[8])])
+    return pd.DataFrame(rows,columns=['code','price','prev_close','time','volume']).set_index('code')
+
+#数据源注册表：每次请求选当前最健康(耗时+失败率)的数据源，失败立即切换，超过耗时分位数未返回时对冲请求次优源
+def get_price_tx(code, end_date='', count=10, frequency='1d'):              #腾讯K线，按周期选日线/分钟线接口
+    if frequency in ['1d','1w','1M']: return get_price_day_tx(code,end_date=end_date,count=count,frequency=frequency)
+    return get_price_min_tx(code,end_date=end_date,count=count,frequency=frequency)
+
+kline_providers=ProviderRegistry('kline');          realtime_providers=ProviderRegistry('realtime')
+kline_providers.register('sina',get_price_sina,supports=['1d','1w','1M','5m','15m','30m','60m'])   #新浪没有1分钟线
+kline_providers.register('tx',  get_price_tx)
+realtime_providers.register('tx',  get_realtime_quotes_tx)
+realtime_providers.register('sina',get_realtime_quotes_sina)
+
+def get_realtime_quotes(codes, chunk=100):                                  #多代码实时行情，每chunk个代码一次请求
+    xcodes={code.replace('.XSHG','').replace('.XSHE',''):code for code in codes}       #证券代码编码兼容处理
+    xcodes={('sh'+x if 'XSHG' in c else 'sz'+x if 'XSHE' in c else x):c for x,c in xcodes.items()}
+    keys=list(xcodes);   dfs=[]
+    for i in range(0,len(keys),chunk):
+        dfs.append(realtime_providers.call(keys[i:i+chunk]))                #腾讯/新浪按健康评分选择
+    df=pd.concat(dfs) if dfs else pd.DataFrame(columns=['price','prev_close','time','volume'])
+    df.loc[df.price<=0,'price']=df.prev_close                               #停牌或开盘前最新价为0，用昨收代替
+    df.index=[xcodes.get(x,x) for x in df.index];   df.index.name='code'    #还原为调用方传入的代码
+    return df
+
+def get_price(code, end_date='',count=10, frequency='1d', fields=[], store=None):        #对外暴露只有唯一函数，这样对用户才是最友好的  
     xcode= code.replace('.XSHG','').replace('.XSHE','')                      #证券代码编码兼容处理 
     xcode='sh'+xcode if ('XSHG' in code)  else  'sz'+xcode  if ('XSHE' in code)  else code     
+    if store is not None:                                                    #store本地历史库(HistoryStore)，覆盖所需区间时不发请求，否则只补拉缺失的K线
+         return store.get(xcode,frequency,count,end_date,lambda n,e: get_price(xcode,end_date=e,count=n,frequency=frequency))
 
-    if  frequency in ['1d','1w','1M']:   #1d日线  1w周线  1M月线
-         try:    return get_price_sina( xcode, end_date=end_date,count=count,frequency=frequency)   #主力
-         except: return get_price_day_tx(xcode,end_date=end_date,count=count,frequency=frequency)   #备用                    
-    
-    if  frequency in ['1m','5m','15m','30m','60m']:  #分钟线 ,1m只有腾讯接口  5分钟5m   60分钟60m
-         if frequency in '1m': return get_price_min_tx(xcode,end_date=end_date,count=count,frequency=frequency)
-         try:    return get_price_sina(  xcode,end_date=end_date,count=count,frequency=frequency)   #主力   
-         except: return get_price_min_tx(xcode,end_date=end_date,count=count,frequency=frequency)   #备用
+    if  frequency in ['1d','1w','1M','1m','5m','15m','30m','60m']:   #1d日线 1w周线 1M月线  分钟线1m只有腾讯接口
+         return kline_providers.call(xcode,end_date=end_date,count=count,frequency=frequency,kind=frequency)
         
 if __name__ == '__main__':    
     df=get_price('sh000001',frequency='1d',count=10)      #支持'1d'日, '1w'周, '1M'月  
@@ -66,4 +108,10 @@ if __name__ == '__main__':
     df=get_price('000001.XSHG',frequency='15m',count=10)  #支持'1m','5m','15m','30m','60m'
     print('上证指数分钟线\n',df)
 
+    df=get_realtime_quotes(['sh510300','sz159915','000001.XSHG'])   #多个代码一次请求
+    print('实时行情\n',df)
+
+    from data_utils.providers import provider_stats
+    for registry in provider_stats(): print('数据源统计',registry)
+
 # Ashare 股票行情数据( https://github.com/mpquant/Ashare ) 
@@ -0,0 +1,215 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+from data_utils import metrics
+
+AUTH_WORKERS = 2        # 同时进行的 bcrypt 校验数（每次约 100-300 ms CPU）
+MAX_PER_USER = 1        # 同一账号同时进行的校验数
+MAX_PER_IP = 3          # 同一 IP 同时进行的校验数
+AUTH_TIMEOUT = 5        # 等待校验结果的上限（秒），含排队时间
+VERIFIED_TTL = 300      # 校验通过后多久内同一账号+密码不再重新计算 bcrypt（秒）
+VERIFIED_MAXSIZE = 1024
+TOKEN_CACHE_SIZE = 4096  # 一键登录令牌缓存条数
+TOKEN_CACHE_TTL = 600    # 令牌缓存最长保留时间（秒），限制其他进程作废令牌后的可见延迟
+
+_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+
+
+class AuthBusy(Exception):
+    """同一账号或 IP 的校验请求过多，请稍后再试"""
+
+
+class _Limiter:
+    """按键限制并发数，超过上限立即拒绝而不排队"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        if key is None:
+            return True
+        with self._lock:
+            if self.active.get(key, 0) >= self.limit:
+                return False
+            self.active[key] = self.active.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        if key is None:
+            return
+        with self._lock:
+            self.active[key] -= 1
+            if not self.active[key]:
+                del self.active[key]
+
+
+_user_limiter = _Limiter(MAX_PER_USER)
+_ip_limiter = _Limiter(MAX_PER_IP)
+_verified = {}  # 校验凭据 -> 过期时间
+_verified_lock = threading.Lock()
+
+
+def _verified_key(password, hashed):
+    """由密码和库中哈希派生的缓存键：改密码后旧键自然失效，缓存中也不保存明文"""
+    return hashlib.sha256(hashed + b"\0" + password.encode("utf-8")).digest()
+
+
+def _recently_verified(key):
+    with _verified_lock:
+        expires_at = _verified.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del _verified[key]
+            return False
+        return True
+
+
+def _remember_verified(key):
+    now = time.monotonic()
+    with _verified_lock:
+        if len(_verified) >= VERIFIED_MAXSIZE:
+            for k in [k for k, t in _verified.items() if t < now] or list(_verified)[:VERIFIED_MAXSIZE // 4]:
+                del _verified[k]
+        _verified[key] = now + VERIFIED_TTL
+
+
+def verify_password(password, hashed, username=None, ip=None, timeout=AUTH_TIMEOUT):
+    """
+    校验密码，bcrypt 计算放到有界线程池中执行（bcrypt 计算时释放 GIL，不阻塞其他会话）
+    - 同一账号、同一 IP 的并发校验数超过上限，或排队+计算超过 timeout 时抛出 AuthBusy
+    - 最近校验通过的账号+密码在 VERIFIED_TTL 内直接通过（示例账号反复点击不再重复计算）
+    - 耗时记入 metrics：auth.verify（含排队）、auth.bcrypt（纯计算）
+    """
+    start = time.perf_counter()
+    key = _verified_key(password, hashed)
+    if _recently_verified(key):
+        metrics.incr("auth.cache_hit")
+        metrics.observe("auth.verify", time.perf_counter() - start)
+        return True
+
+    if not _user_limiter.acquire(username):
+        metrics.incr("auth.rejected")
+        raise AuthBusy("该账号正在登录中，请稍后再试")
+    if not _ip_limiter.acquire(ip):
+        _user_limiter.release(username)
+        metrics.incr("auth.rejected")
+        raise AuthBusy("登录尝试过于频繁，请稍后再试")
+    try:
+        future = _pool.submit(metrics.run_in_context(_checkpw), password, hashed)
+    except BaseException:
+        _release_slots(username, ip)
+        raise
+    # 名额在池中的任务结束（算完或被取消）时才释放：超时返回后仍在计算的任务继续占用名额，限流才真正限制线程池的工作量
+    future.add_done_callback(lambda _: _release_slots(username, ip))
+    try:
+        ok = future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()  # 仍在排队的任务直接取消，不再占用线程池
+        metrics.incr("auth.timeout")
+        raise AuthBusy("登录校验超时，请稍后再试") from None
+
+    if ok:
+        _remember_verified(key)
+    metrics.incr("auth.success" if ok else "auth.failure")
+    metrics.observe("auth.verify", time.perf_counter() - start)
+    return ok
+
+
+def _release_slots(username, ip):
+    _user_limiter.release(username)
+    _ip_limiter.release(ip)
+
+
+def _checkpw(password, hashed):
+    with metrics.timer("auth.bcrypt"):
+        return bcrypt.checkpw(password.encode("utf-8"), hashed)
+
+
+class TokenCache:
+    """
+    一键登录令牌缓存：令牌 -> (用户名, 令牌过期时间)，LRU 淘汰
+    只缓存数据库确认有效的令牌；本进程刷新/禁用令牌时按用户名作废
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (username, token_expire, cached_until)
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        """返回令牌对应的用户名；未缓存、令牌已过期或缓存已过期时返回 None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                metrics.incr("token_cache.miss")
+                return None
+            username, token_expire, cached_until = entry
+            if now > token_expire or now > cached_until:
+                del self._entries[token]
+                metrics.incr("token_cache.miss")
+                return None
+            self._entries.move_to_end(token)
+        metrics.incr("token_cache.hit")
+        return username
+
+    def put(self, token, username, token_expire, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries[token] = (username, token_expire, now + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username):
+        """作废某个用户的所有缓存令牌（刷新URL、禁用登录后调用）"""
+        with self._lock:
+            for token in [t for t, entry in self._entries.items() if entry[0] == username]:
+                del self._entries[token]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+def forget_verified():
+    """清空校验缓存（例如修改密码后）"""
+    with _verified_lock:
+        _verified.clear()
+
+
+if __name__ == '__main__':
+    # 基准测试：重复登录命中缓存，以及线程池内并行校验
+    hashed = bcrypt.hashpw(b"1", bcrypt.gensalt())
+
+    for i in range(5):
+        t0 = time.perf_counter()
+        verify_password("1", hashed, username="1")
+        print(f"第 {i + 1} 次登录：{(time.perf_counter() - t0) * 1000:.1f} ms")
+    forget_verified()
+
+    n = 8
+    hashes = [bcrypt.hashpw(b"1", bcrypt.gensalt()) for _ in range(n)]
+    t0 = time.perf_counter()
+    for h in hashes:
+        bcrypt.checkpw(b"1", h)
+    serial = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(n) as callers:
+        list(callers.map(lambda i: verify_password("1", hashes[i], username=f"u{i}", ip=f"ip{i}", timeout=60), range(n)))
+    pooled = time.perf_counter() - t0
+    print(f"{n} 个不同账号同时登录：串行 {serial:.2f} s，线程池（{AUTH_WORKERS} 个工作线程）{pooled:.2f} s")
+    print("auth.verify:", metrics.timing_summary("auth.verify"))
+    print("auth.bcrypt:", metrics.timing_summary("auth.bcrypt"))
+    print("计数:", {k: v for k, v in metrics.totals().items() if k.startswith("auth.")})
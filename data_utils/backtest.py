@@ -0,0 +1,284 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from data_utils.portfolio import flatten_categories
+from data_utils.portfolio_history import FFILL_LIMIT, TRADING_DAYS_PER_YEAR, unit_prices
+from data_utils.rebalance import EXCLUDED_CATEGORIES, REBALANCE_THRESHOLD, TYPE_CODES, compute_orders
+
+CHECK_FREQUENCIES = {"D": "每日", "W": "每周", "M": "每月", "Q": "每季"}  # 检查是否需要调仓的频率
+SWEEP_THRESHOLDS = tuple(round(t, 2) for t in np.arange(0.05, 0.501, 0.05))
+SETTLEMENT = "结算现金"  # 持仓中没有现金时，用于记录买卖资金进出的虚拟现金
+TRADE_SCAN_BLOCK = 32    # 回测时每次批量检查的检查日数（未触发调仓时逐次翻倍）
+POOL_MIN_GRID = 200      # 组合数少于此值时默认在当前进程内顺序执行（几十个组合只需零点几秒，比启动进程池还快）
+
+
+@dataclass(frozen=True)
+class BacktestSetup:
+    """回测输入（与阈值、频率无关，参数扫描时各组合共用一份）"""
+    dates: pd.DatetimeIndex
+    names: list
+    unit: np.ndarray       # 日期 × 标的 的单位价格，缺价为 0（该标的当天既不计价也不交易）
+    cat_idx: np.ndarray    # 各标的所属小类在 categories 中的下标，不在目标配置中为 -1
+    types: np.ndarray      # 各标的类型编码，见 TYPE_CODES
+    shares: np.ndarray     # 期初份额
+    categories: list       # 小类全名
+    targets: np.ndarray    # 各小类目标比例
+    skip: np.ndarray       # 各小类是否不参与调仓（如 机动-现金）
+    settle: int            # 买卖资金进出的现金标的下标
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    """
+    一次回测的结果
+    value    组合每日总价值
+    weights  各小类每日占比（不含不参与调仓的小类）
+    trades   每笔交易：日期/标的/调整份额/成交价/调整价值
+    summary  汇总指标，见 summarize
+    """
+    threshold: float
+    frequency: str
+    value: pd.Series
+    weights: pd.DataFrame
+    trades: pd.DataFrame
+    summary: dict
+
+
+def prepare(assets_info, categories, prices, ffill_limit=FFILL_LIMIT, excluded=EXCLUDED_CATEGORIES):
+    """
+    整理回测输入：期初持有 assets_info 中的当前份额，目标比例取自 categories
+    prices: 日期 × 代码 的收盘价/单位净值（如 portfolio_history.load_prices 的结果）
+    交易资金从第一个现金标的进出；没有现金标的时增加一个虚拟的结算现金（不属于任何目标小类）
+    """
+    _, target_ratio_sub = flatten_categories(categories)
+    names = list(assets_info)
+    infos = list(assets_info.values())
+    dates, unit = unit_prices(assets_info, prices, ffill_limit)
+    types = np.array([TYPE_CODES.get(info["type"], -1) for info in infos], dtype=np.int64)
+    shares = np.array([info["amount"] for info in infos], dtype=np.float64)
+    keys = list(target_ratio_sub)
+    cat_idx = pd.Index(keys).get_indexer([info["category"] for info in infos])
+
+    cash = np.flatnonzero(types == TYPE_CODES["cash"])
+    if len(cash):
+        settle = int(cash[0])
+    else:
+        names.append(SETTLEMENT)
+        unit = np.column_stack([unit, np.ones(len(dates))])
+        types = np.append(types, TYPE_CODES["cash"])
+        shares = np.append(shares, 0.0)
+        cat_idx = np.append(cat_idx, -1)
+        settle = len(names) - 1
+
+    return BacktestSetup(
+        dates=pd.DatetimeIndex(dates),
+        names=names,
+        unit=np.nan_to_num(unit, nan=0.0),
+        cat_idx=np.asarray(cat_idx, dtype=np.int64),
+        types=types,
+        shares=shares,
+        categories=keys,
+        targets=np.array([target_ratio_sub[k] for k in keys], dtype=np.float64),
+        skip=np.array([k in excluded for k in keys], dtype=bool),
+        settle=settle,
+    )
+
+
+def check_rows(dates, frequency):
+    """各检查日在 dates 中的行号：每个周期（日/周/月/季）的第一个交易日，首日总是检查"""
+    if frequency == "D":
+        return np.arange(len(dates))
+    periods = pd.DatetimeIndex(dates).to_period(frequency).asi8
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) if len(dates) else np.arange(0)
+
+
+def run_backtest(setup, threshold=REBALANCE_THRESHOLD, frequency="M", fee_rate=0.0):
+    """
+    按页面的调仓规则（compute_orders：小类相对偏差达到阈值才调仓，场内整手、场外0.01份、不卖空、现金不参与）
+    在每个检查日用当天收盘价回放
+    两次调仓之间份额不变，因此把之后一段检查日按当前份额一次性批量计算，直接跳到下一个真正产生交易的检查日，
+    循环次数约等于调仓次数而不是检查日数；每日价值同样整段向量化计算
+    fee_rate: 按成交金额收取的费率，从现金中扣除
+    """
+    unit = setup.unit
+    rows = check_rows(setup.dates, frequency)
+    shares = setup.shares.copy()
+    changes = [(0, shares.copy())]  # (检查日序号, 调仓后的份额)
+    trade_rows, trade_adjust = [], []
+    fees = 0.0
+    k, block = 0, TRADE_SCAN_BLOCK
+    while k < len(rows):
+        price = unit[rows[k:k + block]]
+        adjust = compute_orders(
+            setup.cat_idx, setup.types, shares, shares * price, setup.targets, threshold, setup.skip,
+        )["adjust"]
+        traded = np.flatnonzero(adjust.any(axis=1))
+        if not len(traded):
+            k += block
+            block *= 2  # 长时间不触发时扩大批量
+            continue
+        first = int(traded[0])
+        adjust, price = adjust[first], price[first]
+        flow = adjust * price
+        fee = np.abs(flow).sum() * fee_rate
+        shares = shares + adjust
+        shares[setup.settle] -= flow.sum() + fee
+        fees += fee
+        trade_rows.append(rows[k + first])
+        trade_adjust.append(adjust)
+        changes.append((k + first, shares.copy()))  # 调仓当天收盘后即按新份额计价
+        k += first + 1
+        block = TRADE_SCAN_BLOCK
+
+    held = np.empty((len(rows), len(shares)))
+    for (start, held_shares), (end, _) in zip(changes, changes[1:] + [(len(rows), None)]):
+        held[start:end] = held_shares
+
+    # 每天的持有份额 = 最近一个检查日调仓后的份额
+    path = held[np.searchsorted(rows, np.arange(len(setup.dates)), side="right") - 1]
+    values = path * unit
+    total = values.sum(axis=1)
+    slot = np.where(setup.cat_idx >= 0, setup.cat_idx, len(setup.categories))
+    onehot = np.zeros((len(slot), len(setup.categories) + 1))
+    onehot[np.arange(len(slot)), slot] = 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = (values @ onehot)[:, :-1] / total[:, None]
+    keep = ~setup.skip
+
+    trades = _trade_table(setup, trade_rows, trade_adjust)
+    value = pd.Series(total, index=setup.dates, name="组合价值")
+    weights = pd.DataFrame(weights[:, keep], index=setup.dates, columns=np.array(setup.categories)[keep])
+    return BacktestResult(
+        threshold=threshold,
+        frequency=frequency,
+        value=value,
+        weights=weights,
+        trades=trades,
+        summary=summarize(value, weights, setup.targets[keep], trades, fees, len(trade_rows)),
+    )
+
+
+def _trade_table(setup, trade_rows, trade_adjust):
+    if not trade_rows:
+        return pd.DataFrame(columns=["日期", "标的", "调整份额", "成交价", "调整价值"])
+    adjust = np.array(trade_adjust)
+    prices = setup.unit[trade_rows]
+    which, asset = np.nonzero(adjust)
+    return pd.DataFrame({
+        "日期": setup.dates[np.array(trade_rows)[which]],
+        "标的": np.array(setup.names)[asset],
+        "调整份额": adjust[which, asset],
+        "成交价": prices[which, asset],
+        "调整价值": adjust[which, asset] * prices[which, asset],
+    })
+
+
+def summarize(value, weights, targets, trades, fees=0.0, rebalances=None):
+    """
+    回测汇总指标
+    final_value     期末价值
+    total_return    期间总收益率
+    trades          交易笔数（每个标的每次调整计一笔）
+    rebalances      发生调仓的检查日数
+    turnover        年化换手率：成交金额之和 / 平均组合价值 / 年数
+    tracking_error  各小类权重与目标之差的平方和开方，按日平均（越小越贴近目标配置）
+    fees            手续费合计
+    """
+    years = max(len(value), 1) / TRADING_DAYS_PER_YEAR
+    mean_value = float(value.mean()) if len(value) else 0.0
+    traded = float(trades["调整价值"].abs().sum()) if len(trades) else 0.0
+    gap = np.sqrt(np.nansum((weights.to_numpy() - targets) ** 2, axis=1)) if len(weights) else np.zeros(0)
+    return {
+        "final_value": float(value.iloc[-1]) if len(value) else 0.0,
+        "total_return": float(value.iloc[-1] / value.iloc[0] - 1) if len(value) and value.iloc[0] else 0.0,
+        "trades": len(trades),
+        "rebalances": len(trades["日期"].unique()) if rebalances is None else rebalances,
+        "turnover": traded / mean_value / years if mean_value else 0.0,
+        "tracking_error": float(gap.mean()) if len(gap) else 0.0,
+        "fees": float(fees),
+    }
+
+
+SWEEP_COLUMNS = {
+    "threshold": "阈值", "frequency": "检查频率", "final_value": "期末价值", "total_return": "总收益率",
+    "trades": "交易笔数", "rebalances": "调仓次数", "turnover": "年化换手率", "tracking_error": "跟踪误差", "fees": "手续费",
+}
+
+_worker_setup = None
+
+
+def _init_worker(setup):
+    global _worker_setup
+    _worker_setup = setup
+
+
+def _sweep_one(args):
+    threshold, frequency, fee_rate = args
+    result = run_backtest(_worker_setup, threshold, frequency, fee_rate)
+    return {"threshold": threshold, "frequency": frequency, **result.summary}
+
+
+def sweep(setup, thresholds=SWEEP_THRESHOLDS, frequencies=tuple(CHECK_FREQUENCIES), fee_rate=0.0, max_workers=None):
+    """
+    阈值 × 检查频率 的参数扫描，返回每个组合的汇总指标（列名见 SWEEP_COLUMNS）
+    各组合相互独立，可用进程池并行；回测输入只在每个工作进程初始化时传一次
+    max_workers: 默认组合数达到 POOL_MIN_GRID 时取 CPU 核数，否则在当前进程内顺序执行；为 1 时总是顺序执行
+    进程池以 spawn 方式启动：在多线程的进程（如 Streamlit 服务）中 fork 可能死锁
+    """
+    grid = [(float(t), f, fee_rate) for f, t in product(frequencies, thresholds)]
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if len(grid) >= POOL_MIN_GRID else 1
+    max_workers = min(max_workers, len(grid))
+    if max_workers <= 1:
+        _init_worker(setup)
+        rows = [_sweep_one(args) for args in grid]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(setup,)) as pool:
+            rows = list(pool.map(_sweep_one, grid, chunksize=max(1, len(grid) // (max_workers * 4))))
+    return pd.DataFrame(rows).rename(columns=SWEEP_COLUMNS)
+
+
+if __name__ == '__main__':
+    # 基准测试：20 个标的 5 年日线，单次回测耗时，以及 阈值 × 频率 的参数扫描（顺序 vs 进程池）
+    import time
+
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range(end="2026-09-30", periods=5 * TRADING_DAYS_PER_YEAR)
+    categories = {
+        "股票": {"ratio": 0.5, "subcategories": {"内地/沪深": 0.3, "全球/美股": 0.2}},
+        "债券": {"ratio": 0.4, "subcategories": {"利率/国债": 0.25, "信用/信用": 0.15}},
+        "机动": {"ratio": 0.1, "subcategories": {"现金": 0.1}},
+    }
+    subs = ["股票-内地/沪深", "股票-全球/美股", "债券-利率/国债", "债券-信用/信用"]
+    vols = {"股票": 0.015, "债券": 0.002}
+    prices, assets_info = {}, {}
+    for i in range(20):
+        category = subs[i % 4]
+        code = f"sh51{i:04d}" if i % 2 else f"{i:06d}"
+        walk = np.exp(np.cumsum(rng.normal(0.0002, vols[category.split("-")[0]], len(days))))
+        prices[code] = walk
+        assets_info[f"标的{i}"] = {
+            "code": code, "type": "etf" if i % 2 else "fund", "amount": 10000.0, "category": category, "remark": "",
+        }
+    assets_info["现金"] = {"code": "", "type": "cash", "amount": 20000.0, "category": "机动-现金", "remark": ""}
+    prices = pd.DataFrame(prices, index=days)
+
+    setup = prepare(assets_info, categories, prices)
+    t0 = time.perf_counter()
+    result = run_backtest(setup, REBALANCE_THRESHOLD, "D")
+    print(f"单次回测（每日检查，{len(days)} 天 × {len(setup.names)} 个标的）：{(time.perf_counter() - t0) * 1000:.0f} ms")
+    print({k: round(v, 4) for k, v in result.summary.items()})
+
+    for workers in (1, os.cpu_count() or 1):
+        t0 = time.perf_counter()
+        table = sweep(setup, fee_rate=0.0005, max_workers=workers)
+        print(f"参数扫描 {len(table)} 组（{workers} 个进程）：{time.perf_counter() - t0:.2f} s")
+    pd.set_option("display.width", 200)
+    print(table.sort_values("跟踪误差").head(10).round(4).to_string(index=False))
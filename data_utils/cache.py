@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from data_utils.trading_calendar import default_calendar
+
+TRADING_TTL = 60        # 盘中行情缓存时间（秒）
+FUND_NAV_TTL = 1800     # 收盘后基金净值陆续公布，期间每半小时刷新一次
+MAX_STALE = 7 * 86400   # 过期超过该时长的旧值不再直接返回，改为同步刷新
+
+
+def market_open(now=None, calendar=None):
+    """当前是否处于交易时段（含集合竞价，节假日休市）"""
+    return (calendar or default_calendar()).is_open(now)
+
+
+def market_ttl(key, now=None, calendar=None):
+    """
+    行情缓存时间（秒）：缓存到价格下一次可能变化的时刻
+    盘中为 TRADING_TTL；休市（收盘后、午休、周末、节假日）缓存到下一次开盘。
+    场外基金（键以 fund: 开头）的净值在交易日收盘后公布（QDII 等可能晚到次日），
+    从收盘到下一次开盘（含夜间、周末、节假日）按 FUND_NAV_TTL 刷新，净值公布前缓存的旧值不会一直留到下个交易日；
+    交易日开盘后缓存到当天收盘。
+    """
+    calendar = calendar or default_calendar()
+    now = now or calendar.now()
+    if key.startswith("fund:"):
+        if calendar.is_trading_day(now) and calendar.sessions[0][0] <= now.time() < calendar.sessions[-1][1]:
+            return (calendar.next_close(now) - now).total_seconds()
+        return FUND_NAV_TTL
+
+    if calendar.is_open(now):
+        return TRADING_TTL
+    return (calendar.next_open(now) - now).total_seconds()
+
+
+class QuoteCache:
+    """
+    跨会话共享的行情缓存
+    - 内存 LRU，可选 SQLite 磁盘层（进程重启后仍可命中）
+    - 过期的值先直接返回，同时在后台刷新（stale-while-revalidate）
+    - 同一个键同时只有一个加载请求，其他调用方等待同一结果
+    值需可被 json 序列化，键为字符串（如 "etf:sh510300"）。
+    """
+
+    def __init__(self, maxsize=2048, ttl=market_ttl, max_stale=MAX_STALE, db_path=None, refresh_workers=4):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = OrderedDict()  # 键 -> (值, 过期时间戳, 写入时间戳)
+        self._inflight = {}            # 键 -> Future
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="quote-refresh")
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS quotes "
+                "(key TEXT PRIMARY KEY, value TEXT, expires_at REAL, fetched_at REAL)"
+            )
+            self._db.commit()
+
+    def get_many(self, keys, loader, timeout=None):
+        """
+        批量读取缓存
+        keys: 缓存键列表
+        loader: 加载函数，接收键列表，返回 {键: 值}；未返回的键视为加载失败
+        timeout: 等待其他调用方正在进行的加载的上限（秒）
+        返回 (values, errors)
+        """
+        now = time.time()
+        values, errors = {}, {}
+        entries = self._lookup(keys)
+
+        stale, missing = [], []
+        for key in keys:
+            entry = entries.get(key)
+            if entry is None or now - entry[1] > self.max_stale:
+                missing.append(key)
+                continue
+            values[key] = entry[0]
+            if now >= entry[1]:
+                stale.append(key)
+
+        # 过期值已返回，后台刷新即可
+        _, own = self._claim(stale)
+        if own:
+            self._refresher.submit(self._load, own, loader)
+
+        if missing:
+            futures, own = self._claim(missing)
+            if own:
+                self._load(own, loader)
+            wait(futures.values(), timeout=timeout)
+            for key in missing:
+                future = futures[key]
+                if not future.done():
+                    errors[key] = TimeoutError("行情加载超时")
+                elif future.exception() is not None:
+                    errors[key] = future.exception()
+                else:
+                    values[key] = future.result()
+        return values, errors
+
+    def invalidate(self, keys=None):
+        """使指定键（默认全部）立即过期，下次读取时同步刷新"""
+        with self._lock:
+            for key in list(self._entries) if keys is None else keys:
+                self._entries.pop(key, None)
+            if self._db is not None:
+                if keys is None:
+                    self._db.execute("DELETE FROM quotes")
+                else:
+                    self._db.executemany("DELETE FROM quotes WHERE key = ?", [(k,) for k in keys])
+                self._db.commit()
+
+    def _lookup(self, keys):
+        """先查内存，再查磁盘层，磁盘命中的条目回填到内存"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            rest = [key for key in keys if key not in found]
+            if rest and self._db is not None:
+                marks = ",".join("?" * len(rest))
+                rows = self._db.execute(
+                    f"SELECT key, value, expires_at, fetched_at FROM quotes WHERE key IN ({marks})", rest
+                ).fetchall()
+                for key, value, expires_at, fetched_at in rows:
+                    found[key] = (json.loads(value), expires_at, fetched_at)
+                    self._put_memory(key, found[key])
+        return found
+
+    def _claim(self, keys):
+        """
+        合并同一个键的并发加载
+        返回 (futures, own)：futures 为每个键对应的 Future，own 为需由当前调用方加载的键
+        """
+        futures, own = {}, []
+        with self._lock:
+            for key in keys:
+                if key not in self._inflight:
+                    self._inflight[key] = Future()
+                    own.append(key)
+                futures[key] = self._inflight[key]
+        return futures, own
+
+    def _load(self, keys, loader):
+        """调用 loader 并写入缓存，结果通过 Future 通知等待方"""
+        try:
+            result = loader(keys)
+        except Exception as e:
+            result, failure = {}, e
+        else:
+            failure = None
+
+        now = time.time()
+        rows = []
+        with self._lock:
+            for key in keys:
+                future = self._inflight.pop(key)
+                if key in result:
+                    entry = (result[key], now + self.ttl(key), now)
+                    self._put_memory(key, entry)
+                    rows.append((key, json.dumps(entry[0]), entry[1], entry[2]))
+                    future.set_result(result[key])
+                else:
+                    # 失败的键不写缓存：后台刷新时旧值保留，下次读取再重试
+                    future.set_exception(failure or ValueError("未返回行情数据"))
+            if rows and self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def _put_memory(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
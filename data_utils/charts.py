@@ -0,0 +1,130 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib import font_manager
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+CHART_CACHE_SIZE = 128   # 缓存的图片数
+PIE_FIGSIZE = (8, 6)
+PIE_DPI = 200            # 与 st.pyplot 默认输出一致
+FONT_PATH = "font/NotoSansSC-VariableFont_wght.ttf"
+FONT_NAME = "Noto Sans SC"
+
+_images = OrderedDict()  # 键 -> 图片字节
+_lock = threading.Lock()
+_font_ready = False
+
+
+def register_font(path=FONT_PATH, name=FONT_NAME):
+    """注册中文字体（每个进程只执行一次；字体文件不存在时沿用默认字体）"""
+    global _font_ready
+    with _lock:
+        if _font_ready:
+            return
+        if os.path.exists(path):
+            font_manager.fontManager.addfont(path)
+            mpl.rcParams["font.sans-serif"] = [name]
+        mpl.rcParams["axes.unicode_minus"] = False
+        _font_ready = True
+
+
+def summary_key(summary, *extra):
+    """分布数据的哈希（标签 + 数值），数值相同的分布得到相同的键"""
+    h = hashlib.sha1()
+    for label in summary.index:
+        h.update(str(label).encode("utf-8") + b"\0")
+    h.update(np.ascontiguousarray(summary.to_numpy(dtype=np.float64)).tobytes())
+    for item in extra:
+        h.update(repr(item).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _cached(key, render):
+    with _lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return _images[key]
+    data = render()
+    with _lock:
+        _images[key] = data
+        _images.move_to_end(key)
+        while len(_images) > CHART_CACHE_SIZE:
+            _images.popitem(last=False)
+    return data
+
+
+def _render_pie(summary, fmt, figsize, dpi):
+    # 直接使用 Figure 而非 pyplot：不进入 pyplot 的全局图形列表，渲染完即可回收
+    register_font()
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.pie(summary.values, labels=summary.index, autopct="%1.1f%%", startangle=90)
+    ax.axis("equal")
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+    fig.clear()
+    return buf.getvalue()
+
+
+def pie_image(summary, fmt="png", figsize=PIE_FIGSIZE, dpi=PIE_DPI):
+    """
+    饼图图片字节（png 或 svg），按分布数据的哈希缓存
+    分布不变时直接返回缓存的图片，不再调用 matplotlib
+    """
+    key = summary_key(summary, fmt, figsize, dpi)
+    return _cached(key, lambda: _render_pie(summary, fmt, figsize, dpi))
+
+
+def pie_spec(summary, label="分类", value="现有价值"):
+    """饼图的 Vega-Lite 描述，由浏览器渲染，服务端不产生绘图开销"""
+    total = float(summary.sum())
+    values = [
+        {label: str(k), value: float(v), "占比": float(v) / total if total else 0.0}
+        for k, v in summary.items()
+    ]
+    return {
+        "data": {"values": values},
+        "encoding": {
+            "theta": {"field": value, "type": "quantitative", "stack": True},
+            "color": {"field": label, "type": "nominal", "sort": None},
+            "order": {"field": "占比", "type": "quantitative", "sort": "descending"},
+            "tooltip": [
+                {"field": label, "type": "nominal"},
+                {"field": value, "type": "quantitative", "format": ",.2f"},
+                {"field": "占比", "type": "quantitative", "format": ".1%"},
+            ],
+        },
+        "layer": [
+            {"mark": {"type": "arc", "outerRadius": 140}},
+            {
+                "mark": {"type": "text", "radius": 165},
+                "encoding": {"text": {"field": "占比", "type": "quantitative", "format": ".1%"}},
+            },
+        ],
+    }
+
+
+if __name__ == '__main__':
+    # 基准测试：首次渲染与缓存命中
+    import time
+
+    import pandas as pd
+
+    summary = pd.Series([4000.0, 3702.0, 1000.0, 5000.0], index=["利率/国债", "内地/沪深", "现金", "信用/信用"])
+    for fmt in ("png", "svg"):
+        t0 = time.perf_counter()
+        data = pie_image(summary, fmt)
+        t1 = time.perf_counter()
+        pie_image(summary.copy(), fmt)
+        t2 = time.perf_counter()
+        print(f"{fmt}: 首次 {(t1 - t0) * 1000:.1f} ms（{len(data) / 1024:.0f} KB），缓存命中 {(t2 - t1) * 1000:.3f} ms")
+    t0 = time.perf_counter()
+    pie_spec(summary)
+    print(f"vega-lite 描述：{(time.perf_counter() - t0) * 1000:.3f} ms")
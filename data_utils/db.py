@@ -0,0 +1,257 @@
+import threading
+import time
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
+
+from data_utils.metrics import MongoCommandCounter
+
+VERSION_FIELD = "assets_version"  # 持仓版本号，每次修改持仓加1，用于乐观并发控制
+
+DB_NAME = "user_db"
+USERS_COLLECTION = "users"
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# 各查询只取需要的字段（不带出密码哈希和整个持仓）
+LOGIN_FIELDS = {"username": 1, "password": 1, "is_active": 1}
+TOKEN_FIELDS = {"username": 1, "token_expire": 1, "_id": 0}
+TOKEN_STATE_FIELDS = {"login_token": 1, "token_expire": 1, "_id": 0}
+EXISTS_FIELDS = {"_id": 1}
+
+# users 集合的索引；邮箱、令牌只对有值的文档建唯一约束（禁用登录后令牌为空串）
+USER_INDEXES = [
+    ("username", {"name": "username_unique", "unique": True}),
+    ("email", {
+        "name": "email_unique", "unique": True,
+        "partialFilterExpression": {"email": {"$type": "string"}},
+    }),
+    ("login_token", {
+        "name": "login_token_unique", "unique": True,
+        "partialFilterExpression": {"login_token": {"$type": "string", "$gt": ""}},
+    }),
+    ("token_expire", {"name": "token_expire"}),
+]
+
+
+def get_client(conn_str):
+    """
+    进程内共享的 MongoClient（所有页面共用一个连接池）
+    首次创建时挂上往返计数并确保 users 集合的索引
+    """
+    with _clients_lock:
+        client = _clients.get(conn_str)
+        if client is None:
+            client = MongoClient(conn_str, event_listeners=[MongoCommandCounter()])
+            ensure_user_indexes(client[DB_NAME][USERS_COLLECTION])
+            _clients[conn_str] = client
+        return client
+
+
+def get_users_collection(conn_str):
+    return get_client(conn_str)[DB_NAME][USERS_COLLECTION]
+
+
+def ensure_user_indexes(collection, purge=True):
+    """
+    启动时确保 users 集合的索引存在（已存在时 create_index 不做任何事）
+    token_expire 是时间戳而非日期，且过期只应作废令牌、不能删除用户，
+    因此不用 MongoDB 的 TTL 索引，而是用普通索引 + purge_expired_tokens 清理
+    返回创建失败的索引（例如已有重复数据时唯一索引建不起来），页面照常运行
+    """
+    failed = {}
+    for field, options in USER_INDEXES:
+        try:
+            collection.create_index([(field, ASCENDING)], **options)
+        except OperationFailure as e:
+            failed[options["name"]] = e
+    if purge:
+        purge_expired_tokens(collection)
+    return failed
+
+
+def purge_expired_tokens(collection, now=None):
+    """作废所有已过期的一键登录令牌，返回清理的用户数"""
+    now = time.time() if now is None else now
+    result = collection.update_many(
+        {"token_expire": {"$gt": 0, "$lt": now}},
+        {"$set": {"login_token": "", "token_expire": 0}},
+    )
+    return result.modified_count
+
+
+def find_login_user(collection, name):
+    """按用户名或邮箱查找登录用户（两个条件分别走各自的唯一索引）"""
+    return collection.find_one({"$or": [{"username": name}, {"email": name}]}, LOGIN_FIELDS)
+
+
+class VersionConflict(Exception):
+    """持仓已被其他页面修改（版本号不匹配），本次修改未写入"""
+
+    def __init__(self, usernames):
+        self.usernames = list(usernames)
+        super().__init__(f"持仓版本已变化：{', '.join(self.usernames)}")
+
+
+def holding_path(name):
+    """
+    标的在用户文档中的字段路径；名称中的「.」和开头的「$」会被 MongoDB 当作路径/操作符，
+    这类名称（早期整体保存 assets_info 时留下的）及空名称无法单独更新，返回 None
+    """
+    if not name or "." in name or name.startswith("$"):
+        return None
+    return f"assets_info.{name}"
+
+
+def merge_holdings(assets, changes):
+    """把一批持仓修改合并到持仓字典的副本上（标的信息为 None 表示删除）"""
+    merged = dict(assets)
+    for name, info in changes.items():
+        if info is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = info
+    return merged
+
+
+def version_filter(username, version):
+    """按版本号匹配用户文档；旧文档没有版本字段时视为版本0"""
+    if version:
+        return {"username": username, VERSION_FIELD: version}
+    return {"username": username, VERSION_FIELD: {"$in": [None, 0]}}
+
+
+def holding_update(username, changes, version, assets=None):
+    """
+    将一批持仓修改合并为一条带版本检查的更新（同一文档内的更新是原子的），返回 (filter, update)
+    changes: {标的名称: 标的信息}，标的信息为 None 表示删除该标的
+    assets: 该版本的全部持仓；有标的名称无法作为字段路径时（见 holding_path）改为整体 $set assets_info，
+            版本检查保证写入时持仓仍是 assets
+    """
+    update = {"$inc": {VERSION_FIELD: 1}}
+    if any(holding_path(name) is None for name in changes):
+        if assets is None:
+            raise ValueError("标的名称为空、包含「.」或以「$」开头时需要提供完整持仓")
+        update["$set"] = {"assets_info": merge_holdings(assets, changes)}
+        return version_filter(username, version), update
+
+    set_fields, unset_fields = {}, {}
+    for name, info in changes.items():
+        if info is None:
+            unset_fields[holding_path(name)] = ""
+        else:
+            set_fields[holding_path(name)] = info
+    if set_fields:
+        update["$set"] = set_fields
+    if unset_fields:
+        update["$unset"] = unset_fields
+    return version_filter(username, version), update
+
+
+def update_holdings(collection, username, changes, version, assets=None):
+    """修改单个用户的持仓，返回新版本号；版本不匹配时抛出 VersionConflict（assets 见 holding_update）"""
+    if not changes:
+        return version or 0
+    result = collection.update_one(*holding_update(username, changes, version, assets))
+    if result.matched_count == 0:
+        raise VersionConflict([username])
+    return (version or 0) + 1
+
+
+def apply_holding_changes(collection, edits):
+    """
+    一次 bulk_write 写入多个用户的持仓修改，只发送变动的标的
+    edits: [(用户名, changes, 读取时的版本号[, 该版本的全部持仓])]，changes 与全部持仓见 holding_update
+    返回 {用户名: 新版本号}；有用户版本不匹配时抛出 VersionConflict（其余用户的修改照常写入）
+    """
+    edits = [(edit[0], edit[1], edit[2], edit[3] if len(edit) > 3 else None) for edit in edits if edit[1]]
+    if not edits:
+        return {}
+    result = collection.bulk_write(
+        [UpdateOne(*holding_update(username, changes, version, assets)) for username, changes, version, assets in edits],
+        ordered=False,
+    )
+    expected = {username: (version or 0) + 1 for username, _, version, _ in edits}
+    if result.matched_count == len(edits):
+        return expected
+
+    # bulk_write 只返回总匹配数，有未匹配时再查出是哪些用户
+    docs = collection.find(
+        {"username": {"$in": list(expected)}},
+        {"username": 1, VERSION_FIELD: 1, "_id": 0},
+    )
+    current = {doc["username"]: doc.get(VERSION_FIELD, 0) for doc in docs}
+    raise VersionConflict([u for u, v in expected.items() if current.get(u) != v])
+
+
+if __name__ == '__main__':
+    # 基准测试：10万用户下按令牌/用户名查询，对比有无索引、有无投影
+    # 设置 MONGO_URI 时连接本地 mongod（可看到索引效果），否则用 mongomock（内存实现，始终全表扫描）
+    import os
+    import random
+    import timeit
+
+    n_users = 100_000
+    uri = os.environ.get("MONGO_URI")
+    if uri:
+        client = MongoClient(uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    collection = client["portfolio_bench"]["users"]
+    collection.drop()
+
+    assets = {
+        f"标的{i}": {"code": f"sh51{i:04d}", "type": "etf", "amount": 100.0 * i, "category": "股票-内地/沪深", "remark": ""}
+        for i in range(20)
+    }
+    now = time.time()
+    docs = [{
+        "username": f"user{i}",
+        "email": f"user{i}@example.com",
+        "password": b"$2b$12$" + os.urandom(53),
+        "login_token": f"{i:064x}" if i % 10 else "",
+        "token_expire": now + (86400 if i % 3 else -86400) if i % 10 else 0,
+        "assets_info": assets,
+        "assets_version": 0,
+    } for i in range(n_users)]
+    t0 = time.perf_counter()
+    collection.insert_many(docs)
+    print(f"写入 {n_users} 个用户：{time.perf_counter() - t0:.1f} s")
+
+    sample = [random.randrange(1, n_users) for _ in range(50)]
+    tokens = [f"{i:064x}" for i in sample if i % 10]
+
+    def by_token(projection):
+        for token in tokens:
+            collection.find_one({"login_token": token}, projection)
+
+    def by_login(projection):
+        for i in sample:
+            collection.find_one({"$or": [{"username": f"user{i}"}, {"email": f"user{i}"}]}, projection)
+
+    def report(label):
+        for name, fn, projection in (
+            ("令牌查询（整文档）", by_token, None),
+            ("令牌查询（投影）", by_token, TOKEN_FIELDS),
+            ("登录查询（整文档）", by_login, None),
+            ("登录查询（投影）", by_login, LOGIN_FIELDS),
+        ):
+            t = min(timeit.repeat(lambda: fn(projection), number=1, repeat=3))
+            count = len(tokens) if fn is by_token else len(sample)
+            print(f"{label} {name}: {t / count * 1000:.3f} ms/次")
+
+    report("无索引")
+    t0 = time.perf_counter()
+    failed = ensure_user_indexes(collection, purge=False)
+    print(f"建索引：{time.perf_counter() - t0:.1f} s，失败：{list(failed)}")
+    report("有索引")
+    if uri:
+        plan = collection.find({"login_token": tokens[0]}).explain()["queryPlanner"]["winningPlan"]
+        print("令牌查询执行计划：", plan.get("inputStage", plan).get("stage"))
+
+    t0 = time.perf_counter()
+    purged = purge_expired_tokens(collection)
+    print(f"清理过期令牌 {purged} 个：{time.perf_counter() - t0:.2f} s")
+    collection.drop()
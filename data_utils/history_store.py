@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from data_utils.trading_calendar import default_calendar
+
+HISTORY_DIR = os.environ.get("PORTFOLIO_HISTORY_DIR", ".cache/history")
+FRESH_FOR = 300  # 盘中文件写入后多少秒内直接使用本地数据，不再补拉最新K线
+
+
+class HistoryStore:
+    """
+    本地K线历史库
+    按 (代码, 周期) 存为 Parquet 文件（root/周期/代码.parquet），索引为时间，列与 get_price 返回值一致。
+    读取时只向数据源补拉最后一根K线之后的数据并追加保存；本地数据覆盖所需区间时不发请求。
+    按交易日历判断：上次写入之后没有交易时段（收盘后、周末、节假日）就不可能有新K线，直接用本地数据。
+    """
+
+    def __init__(self, root=HISTORY_DIR, fresh_for=FRESH_FOR, calendar=None):
+        self.root = root
+        self.fresh_for = fresh_for
+        self.calendar = calendar or default_calendar()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._exhausted = set()  # 数据源已没有更早K线的 (代码, 周期)，进程内记录
+
+    def path(self, code, frequency):
+        return os.path.join(self.root, frequency, f"{code}.parquet")
+
+    def read(self, code, frequency):
+        """读取本地全部K线，不存在时返回 None"""
+        path = self.path(code, frequency)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        if frequency == '1d' and len(df) and (df.index != df.index.normalize()).any():
+            # 旧版本把基金净值时间（北京时间零点）按 UTC 解析，存成了前一天 16:00，换算回北京时间的日期
+            df.index = (df.index + pd.Timedelta(hours=8)).normalize().rename(df.index.name)
+        return df
+
+    def write(self, code, frequency, df):
+        """整体写入（先写临时文件再替换，读者不会读到半个文件）"""
+        path = self.path(code, frequency)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+
+    def append(self, code, frequency, df):
+        """追加K线：与本地数据按时间合并，同一时间以新数据为准（最后一根K线盘中会变化）"""
+        stored = self.read(code, frequency)
+        if stored is not None and not stored.empty:
+            df = pd.concat([stored, df])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+        self.write(code, frequency, df)
+        return df
+
+    def get(self, code, frequency, count, end_date, fetch):
+        """
+        按 get_price 的参数取K线，优先使用本地数据
+        fetch: 数据源取数函数 fetch(count, end_date)，返回最近 count 根（截至 end_date）K线
+        end_date 不晚于本地最后一根K线时是纯历史区间，不补拉最新K线；只有区间超出本地最后一根时才补拉
+        """
+        end = pd.Timestamp(end_date) if end_date else None
+        with self._code_lock(code, frequency):
+            stored = self.read(code, frequency)
+            if stored is None or stored.empty:
+                return self._slice(self._fetch_all(code, frequency, count, end_date, fetch), end, count)
+
+            last = stored.index[-1]
+            # 数据源已经没有更早的K线时，本地不足 count 根也不必再完整拉取
+            exhausted = (code, frequency) in self._exhausted
+            if end is not None and end <= last:
+                covered = stored[stored.index <= end]
+                if len(covered) >= count or exhausted:
+                    return covered.tail(count)  # 历史区间已在本地
+                return self._slice(self._fetch_all(code, frequency, count, end_date, fetch), end, count)
+
+            if len(stored) >= count or exhausted:
+                if end is None and self._is_fresh(code, frequency):
+                    return stored.tail(count)
+                # 只补拉最后一根之后的K线（多取一根覆盖盘中未完成的K线）
+                merged = self._slice(self.append(code, frequency, fetch(self._bars_since(last, frequency), '')), end, count)
+                if len(merged) >= count or exhausted:
+                    return merged
+
+            # 本地历史不够长：按请求区间完整拉取一次并合并
+            return self._slice(self._fetch_all(code, frequency, count, end_date, fetch), end, count)
+
+    def _fetch_all(self, code, frequency, count, end_date, fetch):
+        """按请求区间完整拉取并合并；返回不足 count 根说明数据源没有更早的K线，之后不再为此重复拉取"""
+        df = fetch(count, end_date)
+        if len(df) < count:
+            self._exhausted.add((code, frequency))
+        return self.append(code, frequency, df)
+
+    def _is_fresh(self, code, frequency):
+        """本地数据是否已是最新：写入后没有经过交易时段，或盘中写入不久"""
+        written = os.path.getmtime(self.path(code, frequency))
+        if time.time() - written < self.fresh_for:
+            return True
+        return not self.calendar.traded_between(datetime.fromtimestamp(written, self.calendar.tz))
+
+    def _code_lock(self, code, frequency):
+        """同一文件的读改写串行执行"""
+        with self._lock:
+            return self._locks.setdefault((code, frequency), threading.Lock())
+
+    @staticmethod
+    def _slice(df, end, count):
+        if end is not None:
+            df = df[df.index <= end]
+        return df.tail(count)
+
+    def _bars_since(self, last, frequency):
+        """从 last 到现在最多可能新增的K线数（按交易日历计算），另加一根重叠覆盖 last 本身"""
+        return self.calendar.bars_between(last.to_pydatetime(), None, frequency) + 1
+
+
+_default_store = None
+
+
+def default_store():
+    """进程内共享的默认历史库（目录由环境变量 PORTFOLIO_HISTORY_DIR 指定）"""
+    global _default_store
+    if _default_store is None:
+        _default_store = HistoryStore()
+    return _default_store
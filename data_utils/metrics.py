@@ -0,0 +1,114 @@
+import contextvars
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+_totals = Counter()  # 进程启动以来的累计次数
+_timings = {}        # 进程内各操作最近的耗时样本（秒）
+TIMING_SAMPLES = 1000  # 每个操作保留的样本数
+_lock = threading.Lock()
+_current_run = contextvars.ContextVar("portfolio_run_metrics", default=None)
+
+
+class RunMetrics:
+    """一次页面运行（Streamlit rerun）内的计数"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def get(self, name):
+        with self._lock:
+            return self.counts[name]
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+
+def start_run():
+    """开始一次新的页面运行计数，之后当前线程（及用 run_in_context 提交的任务）的计数都记到这里"""
+    run = RunMetrics()
+    _current_run.set(run)
+    return run
+
+
+def current_run():
+    return _current_run.get()
+
+
+def incr(name, n=1):
+    """累加计数：进程累计 + 当前页面运行（若有）"""
+    with _lock:
+        _totals[name] += n
+    run = _current_run.get()
+    if run is not None:
+        run.incr(name, n)
+
+
+def totals():
+    """进程累计计数的副本"""
+    with _lock:
+        return dict(_totals)
+
+
+def observe(name, seconds):
+    """记录一次耗时：进程内最近样本 + 当前页面运行（若有）"""
+    with _lock:
+        if name not in _timings:
+            _timings[name] = deque(maxlen=TIMING_SAMPLES)
+        _timings[name].append(seconds)
+    run = _current_run.get()
+    if run is not None:
+        run.observe(name, seconds)
+
+
+@contextmanager
+def timer(name):
+    """统计 with 块的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timing_summary(name):
+    """最近样本的耗时统计（毫秒）：次数、p50、p95、最大值；没有样本时返回 None"""
+    with _lock:
+        samples = sorted(_timings.get(name, ()))
+    if not samples:
+        return None
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {"count": len(samples), "p50": pick(0.5), "p95": pick(0.95), "max": samples[-1] * 1000}
+
+
+def run_in_context(fn):
+    """
+    包装要提交到线程池的函数，使其计数记到提交方所在的页面运行
+    须在提交方线程中、每个任务各调用一次：同一个 Context 不能被多个线程同时进入
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """统计 MongoDB 往返次数（每个发往服务器的命令计一次）"""
+
+    def started(self, event):
+        incr("db.round_trips")
+        incr(f"db.{event.command_name}")
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        incr("db.failures")
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from data_utils import metrics
+
+CONNECT_TIMEOUT = 3      # 建立连接超时（秒）
+READ_TIMEOUT = 8         # 读取响应超时（秒）
+MAX_RETRIES = 2          # 失败后最多重试次数（不含首次请求）
+BACKOFF_BASE = 0.2       # 退避基数（秒），第 n 次重试前随机等待 [0, base * 2**n]
+BACKOFF_CAP = 2.0        # 单次退避上限（秒）
+POOL_SIZE = 16           # 每个主机保持的长连接数
+BREAKER_THRESHOLD = 5    # 连续失败多少次后熔断
+BREAKER_COOLDOWN = 30    # 熔断持续时间（秒），到期后放行一个试探请求
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class ProviderUnavailable(requests.ConnectionError):
+    """数据源处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """单个主机的熔断器：连续失败达到阈值后在冷却期内直接拒绝请求"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否放行请求；冷却期结束后只放行一个试探请求（半开状态）"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()  # 试探期间其余请求继续被拒绝
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_sessions = {}
+_breakers = {}
+_lock = threading.Lock()
+
+
+def _host_state(host):
+    """按主机复用 Session（连接池 + keep-alive）和熔断器"""
+    with _lock:
+        if host not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            _breakers[host] = CircuitBreaker()
+        return _sessions[host], _breakers[host]
+
+
+def http_get(url, headers=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=MAX_RETRIES, **kwargs):
+    """
+    行情数据源统一的 GET 请求
+    - 按主机复用长连接
+    - 显式的连接/读取超时
+    - 连接错误、超时、429/5xx 时按带抖动的指数退避重试
+    - 主机连续失败后熔断，冷却期内立即抛出 ProviderUnavailable，调用方可马上切换备用源
+    其余参数透传给 requests.Session.get
+    """
+    host = urlsplit(url).netloc
+    session, breaker = _host_state(host)
+    if not breaker.allow():
+        metrics.incr("provider.rejected")
+        raise ProviderUnavailable(f"{host} 暂时不可用（熔断中）")
+
+    for attempt in range(retries + 1):
+        metrics.incr("provider.calls")
+        metrics.incr(f"provider.{host}")
+        try:
+            r = session.get(url, headers=headers, timeout=timeout, **kwargs)
+            if r.status_code in _RETRY_STATUS:
+                r.close()
+                raise requests.HTTPError(f"{host} 返回 {r.status_code}", response=r)
+            r.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            retryable = not isinstance(e, requests.HTTPError) or e.response is None \
+                or e.response.status_code in _RETRY_STATUS
+            if not retryable:
+                raise
+            if attempt == retries:
+                breaker.record_failure()
+                raise
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+        else:
+            breaker.record_success()
+            return r
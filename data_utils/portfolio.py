@@ -0,0 +1,162 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from data_utils.rebalance import REBALANCE_THRESHOLD, rebalance_plan
+
+HOLDING_COLUMNS = ["代码", "类型", "持有份额", "分类", "备注", "现有价值"]
+COMPARE_COLUMNS = ["现有金额", "当前比例", "目标金额", "目标比例", "差额金额", "差额比例"]
+
+
+@dataclass(frozen=True)
+class PortfolioSnapshot:
+    """
+    某一时刻的组合计算结果（纯数据，不含任何页面渲染）
+    holdings      资产明细，索引为标的名称，列见 HOLDING_COLUMNS，另含「最新价」「大类」「小类」
+    prices        {标的名称: 最新价}
+    total_value   组合总价值
+    sub_summary   各小类现有价值
+    cls_summary   各大类现有价值
+    sub_table     各小类目标对比（比例为百分数），列见 COMPARE_COLUMNS
+    cls_table     各大类目标对比
+    rebalance     各小类偏差与是否需要调仓，见 rebalance_plan
+    orders        各标的建议调整份额，见 rebalance_plan
+    """
+    holdings: pd.DataFrame
+    prices: dict
+    total_value: float
+    target_ratio: dict
+    target_ratio_sub: dict
+    sub_summary: pd.Series
+    cls_summary: pd.Series
+    sub_table: pd.DataFrame
+    cls_table: pd.DataFrame
+    rebalance: pd.DataFrame
+    orders: pd.DataFrame
+
+
+def flatten_categories(categories):
+    """将嵌套的分类结构展平为目标比例字典"""
+    target_ratio = {name: data["ratio"] for name, data in categories.items()}
+    target_ratio_sub = {}
+    for major_name, major_data in categories.items():
+        for minor_name, minor_ratio in major_data["subcategories"].items():
+            full_name = f"{major_name}-{minor_name}"
+            target_ratio_sub[full_name] = minor_ratio
+    return target_ratio, target_ratio_sub
+
+
+def build_snapshot(assets_info, categories, prices, threshold=REBALANCE_THRESHOLD):
+    """
+    由持仓、分类配置和价格计算组合快照（无网络、无数据库、无页面调用）
+    assets_info: {标的名称: {"code", "type", "amount", "category", "remark"}}
+    categories: 嵌套的分类配置
+    prices: {标的名称: 最新价}，缺失的非现金标的按0计价
+    """
+    target_ratio, target_ratio_sub = flatten_categories(categories)
+
+    names = list(assets_info)
+    amounts = np.array([info["amount"] for info in assets_info.values()], dtype=np.float64)
+    is_cash = np.array([info["type"] == "cash" for info in assets_info.values()], dtype=bool)
+    latest = np.array([prices.get(name, 0.0) for name in names], dtype=np.float64)
+    values = np.where(is_cash, amounts, amounts * latest)
+
+    holdings = pd.DataFrame({
+        "代码": [info["code"] for info in assets_info.values()],
+        "类型": [info["type"] for info in assets_info.values()],
+        "持有份额": [info["amount"] for info in assets_info.values()],
+        "分类": [info["category"] for info in assets_info.values()],
+        "备注": [info.get("remark", "无") for info in assets_info.values()],
+        "现有价值": values,
+    }, index=pd.Index(names), columns=HOLDING_COLUMNS)
+    holdings["最新价"] = np.where(is_cash, 1.0, latest)
+    parts = holdings["分类"].astype(str).str.split("-", n=1)
+    holdings["大类"] = parts.str[0]
+    holdings["小类"] = parts.str[1]
+
+    total_value = holdings["现有价值"].sum()
+    sub_summary = holdings.groupby("分类")["现有价值"].sum()
+    cls_summary = holdings.groupby("大类")["现有价值"].sum()
+
+    if names and total_value:
+        category_table, order_table = rebalance_plan(holdings, target_ratio_sub, threshold)
+    else:
+        category_table, order_table = rebalance_plan(holdings.iloc[:0], {}, threshold)
+
+    return PortfolioSnapshot(
+        holdings=holdings,
+        prices=dict(prices),
+        total_value=float(total_value),
+        target_ratio=target_ratio,
+        target_ratio_sub=target_ratio_sub,
+        sub_summary=sub_summary,
+        cls_summary=cls_summary,
+        sub_table=compare_table(sub_summary, target_ratio_sub, total_value, "小类"),
+        cls_table=compare_table(cls_summary, target_ratio, total_value, "大类"),
+        rebalance=category_table,
+        orders=order_table,
+    )
+
+
+def update_snapshot(snapshot, prices, threshold=REBALANCE_THRESHOLD):
+    """
+    价格变化后增量更新快照：只重算价格有变化的标的行，
+    再由各标的价值的变化量更新小类/大类汇总与对比表；价格都没变时原样返回
+    """
+    holdings = snapshot.holdings
+    is_cash = (holdings["类型"] == "cash").to_numpy()
+    latest = np.array([prices.get(name, 0.0) for name in holdings.index], dtype=np.float64)
+    latest = np.where(is_cash, 1.0, latest)
+    changed = latest != holdings["最新价"].to_numpy()
+    if not changed.any():
+        return snapshot
+
+    rows = holdings.index[changed]
+    holdings = holdings.copy()
+    new_values = holdings.loc[rows, "持有份额"].to_numpy(dtype=np.float64) * latest[changed]
+    delta = pd.Series(new_values - holdings.loc[rows, "现有价值"].to_numpy(), index=rows)
+    holdings.loc[rows, "最新价"] = latest[changed]
+    holdings.loc[rows, "现有价值"] = new_values
+
+    sub_summary = snapshot.sub_summary.add(delta.groupby(holdings.loc[rows, "分类"]).sum(), fill_value=0)
+    cls_summary = snapshot.cls_summary.add(delta.groupby(holdings.loc[rows, "大类"]).sum(), fill_value=0)
+    total_value = snapshot.total_value + float(delta.sum())
+    if total_value:
+        category_table, order_table = rebalance_plan(holdings, snapshot.target_ratio_sub, threshold)
+    else:
+        category_table, order_table = rebalance_plan(holdings.iloc[:0], {}, threshold)
+
+    return replace(
+        snapshot,
+        holdings=holdings,
+        prices=dict(prices),
+        total_value=total_value,
+        sub_summary=sub_summary,
+        cls_summary=cls_summary,
+        sub_table=compare_table(sub_summary, snapshot.target_ratio_sub, total_value, "小类"),
+        cls_table=compare_table(cls_summary, snapshot.target_ratio, total_value, "大类"),
+        rebalance=category_table,
+        orders=order_table,
+    )
+
+
+def compare_table(summary, targets, total_value, index_name):
+    """现有金额与目标金额对比表，比例列为百分数"""
+    keys = list(targets)
+    current = summary.reindex(keys, fill_value=0).to_numpy(dtype=np.float64)
+    target_ratio = np.array([targets[k] for k in keys], dtype=np.float64)
+    target_value = total_value * target_ratio
+    diff = current - target_value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        current_ratio = current / total_value * 100
+        diff_ratio = np.where(target_value != 0, diff / target_value * 100, 0.0)
+    table = pd.DataFrame({
+        "现有金额": current,
+        "当前比例": current_ratio,
+        "目标金额": target_value,
+        "目标比例": target_ratio * 100,
+        "差额金额": diff,
+        "差额比例": diff_ratio,
+    }, index=pd.Index(keys, name=index_name))
+    return table
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_utils.price_matrix import align_closes, shared_prices
+
+FFILL_LIMIT = 5              # 某标的连续缺价时最多沿用前值的日期数（长假、QDII 与A股休市日不一致等）
+TRADING_DAYS_PER_YEAR = 250  # 按年数估算需要读取的K线根数
+
+
+@dataclass(frozen=True)
+class PortfolioHistory:
+    """
+    按当前持仓份额回溯的每日组合价值（没有历史交易记录，份额视为一直不变）
+    values       各标的每日价值，索引为日期，列为标的名称
+    total        组合每日总价值
+    sub_weights  各小类每日占比，列为分类全名（大类-小类）
+    cls_weights  各大类每日占比
+    missing      每日缺价的标的数（尚未上市、停牌/缺数据超过 FFILL_LIMIT），这些标的当天按 0 计
+    """
+    values: pd.DataFrame
+    total: pd.Series
+    sub_weights: pd.DataFrame
+    cls_weights: pd.DataFrame
+    missing: pd.Series
+
+
+def ffill_limited(a, limit=FFILL_LIMIT):
+    """按列向前填充 NaN，每段连续缺失最多填充 limit 行（None 不限）；开头的缺失保持 NaN"""
+    rows = np.arange(a.shape[0])[:, None]
+    last = np.where(np.isnan(a), -1, rows)
+    np.maximum.accumulate(last, axis=0, out=last)
+    filled = a[np.maximum(last, 0), np.arange(a.shape[1])]
+    keep = last >= 0
+    if limit is not None:
+        keep &= rows - last <= limit
+    return np.where(keep, filled, np.nan)
+
+
+def _group_sum(values, labels):
+    """按标签把 日期 × 标的 的价值汇总为 日期 × 分类（一次矩阵乘法）"""
+    codes, groups = pd.factorize(pd.Index(labels), sort=False)
+    onehot = np.zeros((len(labels), len(groups)), dtype=values.dtype)
+    onehot[np.arange(len(labels)), codes] = 1.0
+    return values @ onehot, list(groups)
+
+
+def unit_prices(assets_info, prices, ffill_limit=FFILL_LIMIT, trim=True):
+    """
+    日期 × 标的 的单位价格矩阵（列顺序与 assets_info 一致）
+    prices: 日期 × 代码 的收盘价/单位净值 DataFrame（如 align_closes 或 PriceMatrix.slice 的结果），
+            场内 ETF 与场外基金的日期可以不同，按日期并集对齐后各自向前填充（最多 ffill_limit 个日期）
+    现金恒为 1，没有任何历史数据的标的整列为 NaN
+    trim: 从所有有数据的标的都有价格的第一天开始，避免某标的上市前按 0 计造成的跳变
+    返回 (日期索引, ndarray)
+    """
+    infos = list(assets_info.values())
+    is_cash = np.array([info["type"] == "cash" for info in infos], dtype=bool)
+    dates = prices.index
+    matrix = ffill_limited(prices.to_numpy(dtype=np.float64), ffill_limit)
+    columns = {code: i for i, code in enumerate(prices.columns)}
+    cols = np.array([-1 if cash else columns.get(info["code"], -1) for info, cash in zip(infos, is_cash)], dtype=np.intp)
+
+    unit = np.full((len(dates), len(infos)), np.nan)
+    has_col = cols >= 0
+    unit[:, has_col] = matrix[:, cols[has_col]]
+    unit[:, is_cash] = 1.0
+
+    if trim and len(dates):
+        tracked = has_col | is_cash
+        complete = ~np.isnan(unit[:, tracked]).any(axis=1)
+        start = int(np.argmax(complete)) if complete.any() else 0
+        unit, dates = unit[start:], dates[start:]
+    return dates, unit
+
+
+def build_history(assets_info, prices, ffill_limit=FFILL_LIMIT, trim=True):
+    """
+    由持仓和历史价格计算每日组合价值与分类占比（无网络，全部为数组运算）
+    assets_info: {标的名称: {"code", "type", "amount", "category", ...}}，cash 类型按面值计
+    prices、ffill_limit、trim 见 unit_prices
+    """
+    names = list(assets_info)
+    amounts = np.array([info["amount"] for info in assets_info.values()], dtype=np.float64)
+    categories = [str(info["category"]) for info in assets_info.values()]
+    dates, unit = unit_prices(assets_info, prices, ffill_limit, trim)
+
+    priced = ~np.isnan(unit)
+    values = np.where(priced, unit, 0.0) * amounts
+    total = values.sum(axis=1)
+    sub_values, sub_names = _group_sum(values, categories)
+    cls_values, cls_names = _group_sum(values, [c.split("-", 1)[0] for c in categories])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sub_weights = sub_values / total[:, None]
+        cls_weights = cls_values / total[:, None]
+
+    index = pd.DatetimeIndex(dates, name="date")
+    return PortfolioHistory(
+        values=pd.DataFrame(values, index=index, columns=names),
+        total=pd.Series(total, index=index, name="组合价值"),
+        sub_weights=pd.DataFrame(sub_weights, index=index, columns=sub_names),
+        cls_weights=pd.DataFrame(cls_weights, index=index, columns=cls_names),
+        missing=pd.Series((~priced).sum(axis=1), index=index, name="缺价标的数"),
+    )
+
+
+def load_prices(assets_info, years=5, store=None):
+    """
+    读取全部持仓近 years 年的日线（ETF 用 get_price，场外基金用 get_fund_price），对齐为 日期 × 代码 的 DataFrame
+    数据从共享的内存映射价格矩阵（price_matrix.shared_prices）切片，矩阵过期或缺少标的时才重新读取
+    store: 可选的 HistoryStore，本地已有的K线不再请求
+    """
+    holdings = [(info["type"], info["code"]) for info in assets_info.values() if info["type"] in ("etf", "fund")]
+    if not holdings:
+        return pd.DataFrame()
+    matrix = shared_prices(holdings, count=int(years * TRADING_DAYS_PER_YEAR) + 1, store=store)
+    codes = [code for code in dict.fromkeys(code for _, code in holdings) if code in matrix.codes]
+    # 矩阵的日期是所有标的的并集，去掉这些持仓都没有数据的日期
+    prices = matrix.slice(codes).dropna(how="all")
+    prices.index = prices.index.as_unit("ns")
+    if len(prices):
+        prices = prices[prices.index > prices.index[-1] - pd.DateOffset(years=years)]
+    return prices
+
+
+def load_history(assets_info, years=5, store=None, ffill_limit=FFILL_LIMIT, trim=True):
+    """读取近 years 年的历史行情并计算组合历史"""
+    return build_history(assets_info, load_prices(assets_info, years, store), ffill_limit, trim)
+
+
+if __name__ == '__main__':
+    # 基准测试：100 个标的（70 个 ETF + 30 个场外基金）5 年日线，从各自的收盘价序列到组合历史
+    # 场外基金的日期按东方财富的原始时间戳（北京时间零点的毫秒数）经 nav_dates 解析，检查与 ETF 的日期对齐
+    import time
+
+    from data_utils.utils import nav_dates
+
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=5 * TRADING_DAYS_PER_YEAR + 30)
+    nav_times = days.tz_localize("Asia/Shanghai").as_unit("ms").asi8
+    closes, assets_info = {}, {}
+    for i in range(100):
+        kind = "etf" if i < 70 else "fund"
+        code = f"sh51{i:04d}" if kind == "etf" else f"{i:06d}"
+        keep = rng.random(len(days)) > (0.01 if kind == "etf" else 0.05)  # 场外基金日期更稀疏
+        keep[: int(rng.integers(0, 200))] = False                         # 部分标的晚上市
+        walk = np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        index = days[keep] if kind == "etf" else nav_dates(nav_times[keep])
+        closes[code] = pd.Series(walk[keep], index=index)
+        assets_info[f"标的{i}"] = {
+            "code": code, "type": kind, "amount": float(rng.integers(100, 10000)),
+            "category": f"大类{i % 4}-小类{i % 12}", "remark": "",
+        }
+    assets_info["现金"] = {"code": "", "type": "cash", "amount": 10000.0, "category": "现金-现金", "remark": ""}
+
+    for _ in range(3):
+        t0 = time.perf_counter()
+        prices = align_closes(closes)
+        t1 = time.perf_counter()
+        history = build_history(assets_info, prices)
+        t2 = time.perf_counter()
+        print(f"对齐 {(t1 - t0) * 1000:.1f} ms，计算 {(t2 - t1) * 1000:.1f} ms，"
+              f"共 {len(history.total)} 天 × {len(assets_info)} 个标的")
+    print(history.total.tail(3))
+    print(history.cls_weights.tail(3).round(3))
+    print("缺价标的数（最多）：", int(history.missing.max()))
+    assert prices.index.isin(days).all(), "基金净值日期与交易日错位"
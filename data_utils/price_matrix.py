@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_utils import metrics
+from data_utils.Ashare import get_price
+from data_utils.trading_calendar import default_calendar
+from data_utils.utils import get_fund_price
+
+MATRIX_DIR = os.environ.get("PORTFOLIO_MATRIX_DIR", ".cache/matrix")
+KEEP_BUILDS = 2  # 保留最近几次构建，旧版本仍可能被其他进程映射着
+MAX_WORKERS = 8  # 并发读取的标的数
+FRESH_FOR = 300  # 盘中构建后多少秒内直接复用矩阵（同 HistoryStore 的 FRESH_FOR），之后才补上新K线重建
+
+
+def _load_close(source, code, count, store):
+    try:
+        if source == "etf":
+            df = get_price(code, count=count, frequency='1d', store=store)
+        elif source == "fund":
+            df = get_fund_price(code, count=count, store=store)
+        else:
+            return None
+    except Exception:
+        return None
+    return None if df.empty else df['close']
+
+
+def load_closes(holdings, count=1250, store=None, max_workers=MAX_WORKERS):
+    """
+    读取多个标的的日收盘价（单位净值），各标的并发读取
+    holdings: [(类型, 代码)]，类型为 "etf"（get_price 日线）或 "fund"（get_fund_price 净值）
+    count: 每个标的最多取多少根日K线
+    store: 可选的 HistoryStore，本地已有的区间不再请求
+    返回 {代码: 收盘价 Series}，获取失败的标的不出现在结果中
+    """
+    holdings = list(dict.fromkeys(holdings))
+    if not holdings:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(holdings))) as pool:
+        # 在提交方复制上下文（每个任务一份），请求计数才能记到页面运行
+        futures = [
+            pool.submit(metrics.run_in_context(_load_close), source, code, count, store) for source, code in holdings
+        ]
+        series = [future.result() for future in futures]
+    return {code: s for (_, code), s in zip(holdings, series) if s is not None}
+
+
+def align_closes(closes):
+    """
+    将多个收盘价序列按日期对齐为 日期 × 代码 的 DataFrame（日期为各序列日期的并集，缺失值为 NaN）
+    同一天有多个点时（如分钟级时间戳）取当天最后一个
+    """
+    daily = {code: _daily(s) for code, s in closes.items()}
+    if not daily or any(s.index.tz is not None for s in daily.values()):
+        return pd.DataFrame(daily).sort_index()
+    # 直接在 int64 时间戳上求并集并定位，比逐列 reindex 对齐快一个数量级
+    stamps = {code: s.index.as_unit("ns").asi8 for code, s in daily.items()}
+    days = np.unique(np.concatenate(list(stamps.values())))
+    data = np.full((len(days), len(daily)), np.nan)
+    for j, (code, s) in enumerate(daily.items()):
+        data[np.searchsorted(days, stamps[code]), j] = s.to_numpy(dtype=np.float64)
+    return pd.DataFrame(data, index=pd.DatetimeIndex(days.view("datetime64[ns]")), columns=list(daily))
+
+
+_DAY_NS = 86_400 * 10**9
+
+
+def _daily(s):
+    index = s.index
+    if index.tz is None and not (index.as_unit("ns").asi8 % _DAY_NS).any() and index.is_unique:
+        return s  # 已是每天一个点（日线、净值），无需分组
+    return s.groupby(index.normalize()).last()
+
+
+def build_price_matrix(closes, name="prices", root=MATRIX_DIR, dtype=np.float64, holdings=(), count=0):
+    """
+    将多个收盘价序列对齐为 日期 × 代码 的矩阵并写入磁盘（.npy，可内存映射）
+    closes: {代码: 收盘价 Series}，索引为日期；缺失值为 NaN
+    holdings, count: 构建时请求的 [(类型, 代码)] 与每个标的的K线根数，记入元数据供 shared_prices 判断能否复用
+    每次构建写入新的版本目录，最后原子替换 CURRENT 指针，正在读取旧版本的进程不受影响
+    返回构建好的 PriceMatrix
+    """
+    frame = align_closes(closes)
+
+    base = os.path.join(root, name)
+    build_id = f"{time.time_ns()}-{os.getpid()}"
+    build_dir = os.path.join(base, build_id)
+    os.makedirs(build_dir)
+    np.save(os.path.join(build_dir, "data.npy"), np.ascontiguousarray(frame.to_numpy(dtype=dtype)))
+    with open(os.path.join(build_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "codes": list(frame.columns), "dates": [d.strftime("%Y-%m-%d") for d in frame.index],
+            "holdings": [list(h) for h in holdings], "count": count,
+        }, f, ensure_ascii=False)
+
+    pointer = os.path.join(base, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(build_id)
+    os.replace(pointer + ".tmp", pointer)
+
+    builds = sorted(d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d)))
+    for old in builds[:-KEEP_BUILDS]:
+        shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+    return PriceMatrix(build_dir)
+
+
+class PriceMatrix:
+    """
+    只读、内存映射的价格矩阵（行为日期，列为代码）
+    多个进程打开同一份文件时共享操作系统页缓存，不各自复制数据
+    """
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        with open(os.path.join(build_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.codes = meta["codes"]
+        self.dates = np.array(meta["dates"], dtype="datetime64[D]")
+        self.holdings = {tuple(h) for h in meta.get("holdings", [])}
+        self.count = meta.get("count", 0)
+        self.built_at = int(os.path.basename(build_dir).split("-", 1)[0]) / 1e9  # 版本目录名以构建时间（纳秒）开头
+        self.values = np.load(os.path.join(build_dir, "data.npy"), mmap_mode="r")
+        self._columns = {code: i for i, code in enumerate(self.codes)}
+
+    def slice(self, codes=None, start=None, end=None, as_frame=True):
+        """
+        按代码列表和日期区间（含两端）切片
+        日期区间对应连续的行，直接返回映射上的视图；代码列表若不是连续的列，只复制所选数据
+        as_frame: True 返回 DataFrame，False 返回 (日期数组, 代码列表, ndarray)
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start).date(), "D"), "left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end).date(), "D"), "right"))
+        rows = self.values[lo:hi]
+        if codes is None:
+            codes, block = self.codes, rows
+        else:
+            cols = [self._columns[code] for code in codes]
+            if cols and cols == list(range(cols[0], cols[0] + len(cols))):
+                block = rows[:, cols[0]:cols[0] + len(cols)]
+            else:
+                block = rows[:, cols]
+        dates = self.dates[lo:hi]
+        if not as_frame:
+            return dates, list(codes), block
+        return pd.DataFrame(block, index=pd.DatetimeIndex(dates), columns=list(codes), copy=False)
+
+
+_opened = {}
+_lock = threading.Lock()
+
+
+def open_price_matrix(name="prices", root=MATRIX_DIR):
+    """打开最新一次构建的价格矩阵，同一版本在进程内只映射一次；尚未构建时返回 None"""
+    base = os.path.join(root, name)
+    try:
+        with open(os.path.join(base, "CURRENT")) as f:
+            build_dir = os.path.join(base, f.read().strip())
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if build_dir not in _opened:
+            _opened[build_dir] = PriceMatrix(build_dir)
+        return _opened[build_dir]
+
+
+_build_lock = threading.Lock()
+
+
+def shared_prices(holdings, count=1250, store=None, name="prices", root=MATRIX_DIR, calendar=None, fresh_for=FRESH_FOR):
+    """
+    返回包含 holdings 全部标的、每个至少 count 根日K线的共享价格矩阵（PriceMatrix）
+    最新一次构建覆盖这些标的、且构建后没有经过交易时段（或盘中构建不久）时直接复用（各 Streamlit 进程映射同一份文件）；
+    否则用 load_closes 读取（HistoryStore 中已有的K线不再请求）并重新构建。
+    矩阵仍是最新时，新构建保留其中已有的标的，不同用户的持仓逐步合并到同一个矩阵
+    """
+    calendar = calendar or default_calendar()
+    holdings = set(holdings)
+    with _build_lock:
+        matrix = open_price_matrix(name, root)
+        fresh = matrix is not None and (
+            time.time() - matrix.built_at < fresh_for
+            or not calendar.traded_between(datetime.fromtimestamp(matrix.built_at, calendar.tz))
+        )
+        if fresh and holdings <= matrix.holdings and count <= matrix.count:
+            return matrix
+        if fresh:
+            holdings, count = holdings | matrix.holdings, max(count, matrix.count)
+        holdings = sorted(holdings)
+        closes = load_closes(holdings, count=count, store=store)
+        built = build_price_matrix(closes, name, root, holdings=holdings, count=count)
+        with _lock:
+            for old in [d for d in _opened if not os.path.isdir(d)]:
+                del _opened[old]  # 已被清理的旧版本，已取得的映射仍可继续读取
+            _opened[built.build_dir] = built
+        return built
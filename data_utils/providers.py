@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from data_utils import metrics
+
+HEDGE_PERCENTILE = 0.9     # 主请求超过其历史耗时的该分位数仍未返回时，向次优数据源发出对冲请求
+HEDGE_MIN_SAMPLES = 20     # 样本不足时使用 HEDGE_DEFAULT_DELAY
+HEDGE_DEFAULT_DELAY = 1.0  # 默认对冲等待时间（秒）
+HEDGE_MIN_DELAY = 0.05     # 对冲等待时间下限（秒），避免极快的数据源几乎每次都被对冲
+LATENCY_SAMPLES = 200      # 每个数据源保留的最近耗时样本数
+EWMA_ALPHA = 0.2           # 错误率的指数滑动平均系数
+ERROR_HALF_LIFE = 60       # 错误率半衰期（秒），失败过的数据源一段时间后重新有机会成为首选
+FAILURE_COST = 8.0         # 一次失败折算的耗时（秒），与 net.READ_TIMEOUT 相当
+MAX_WORKERS = 16
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="provider")
+_registries = {}
+_lock = threading.Lock()
+
+
+class ProviderStats:
+    """单个数据源的健康状况：最近的耗时样本、错误率的滑动平均"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.error_rate = 0.0      # 失败率的 EWMA，随时间按 ERROR_HALF_LIFE 衰减
+        self.error_at = time.monotonic()
+        self.last_error = None
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def _decayed_error(self, now):
+        return self.error_rate * 0.5 ** ((now - self.error_at) / ERROR_HALF_LIFE)
+
+    def start(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+
+    def record(self, seconds, error=None):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.error_rate = (1 - EWMA_ALPHA) * self._decayed_error(now) + EWMA_ALPHA * (error is not None)
+            self.error_at = now
+            if error is None:
+                self.samples.append(seconds)
+            else:
+                self.failures += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def percentile(self, q):
+        """最近成功请求耗时的分位数（秒），没有样本时返回 None"""
+        with self._lock:
+            samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+    def score(self):
+        """
+        预期耗时（秒）= 耗时中位数 + 失败率 × FAILURE_COST，越小越健康
+        用中位数而非均值：偶发的慢请求交给对冲处理，不会让数据源被长期冷落；从未成功过的数据源按 0 耗时计以便尽快试探
+        """
+        with self._lock:
+            error_rate = self._decayed_error(time.monotonic())
+        return (self.percentile(0.5) or 0.0) + error_rate * FAILURE_COST
+
+    def hedge_delay(self, percentile=HEDGE_PERCENTILE):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.percentile(percentile))
+
+    def snapshot(self):
+        with self._lock:
+            counts = {"calls": self.calls, "failures": self.failures, "in_flight": self.in_flight}
+            error_rate = self._decayed_error(time.monotonic())
+            last_error = self.last_error
+        to_ms = lambda seconds: seconds * 1000 if seconds is not None else None
+        return {
+            **counts,
+            "error_rate": error_rate,
+            "p50_ms": to_ms(self.percentile(0.5)),
+            "p95_ms": to_ms(self.percentile(0.95)),
+            "last_error": last_error,
+        }
+
+
+class ProviderRegistry:
+    """
+    同一类数据（如K线、实时行情）的多个数据源
+    每次请求按健康评分选择当前最优的数据源，失败时立即改用次优数据源；
+    hedge=True 时主请求超过其耗时分位数仍未返回，再向次优数据源发出一个对冲请求，取先成功返回的结果
+    数据源函数需要是幂等的读请求（对冲时两个请求都会真正发出）
+    """
+
+    def __init__(self, name, hedge=True, percentile=HEDGE_PERCENTILE):
+        self.name = name
+        self.hedge = hedge
+        self.percentile = percentile
+        self.providers = {}  # 名称 -> (函数, 支持的周期或 None, 统计)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+        with _lock:
+            _registries[name] = self
+
+    def register(self, name, fn, supports=None):
+        """注册数据源；supports 为支持的 kind 集合（如K线周期），None 表示全部支持。注册顺序即评分相同时的优先级"""
+        self.providers[name] = (fn, frozenset(supports) if supports is not None else None, ProviderStats())
+        return fn
+
+    def candidates(self, kind=None):
+        """支持 kind 的数据源名称，按健康评分从好到差排序"""
+        names = [n for n, (_, supports, _) in self.providers.items() if supports is None or kind in supports]
+        return sorted(names, key=lambda n: self.providers[n][2].score())  # sorted 稳定，评分相同保持注册顺序
+
+    def _submit(self, name, args, kwargs):
+        fn, _, stats = self.providers[name]
+        stats.start()
+        metrics.incr(f"provider.{self.name}.{name}")
+
+        def run():
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                stats.record(time.perf_counter() - start, e)
+                raise
+            stats.record(time.perf_counter() - start)
+            return result
+
+        return _pool.submit(metrics.run_in_context(run))
+
+    def call(self, *args, kind=None, hedge=None, **kwargs):
+        """
+        按健康评分调用数据源，返回第一个成功的结果；全部失败时抛出最后一个异常
+        kind: 用于筛选支持的数据源（如K线周期），不传给数据源函数
+        hedge: 覆盖注册表的对冲设置
+        """
+        hedge = self.hedge if hedge is None else hedge
+        queue = self.candidates(kind)
+        if not queue:
+            raise LookupError(f"{self.name} 没有支持 {kind} 的数据源")
+
+        pending = {}  # future -> 数据源名称
+        hedge_name = None
+        last_error = None
+        while queue or pending:
+            if queue and not pending:
+                name = queue.pop(0)
+                pending[self._submit(name, args, kwargs)] = name
+                deadline = self.providers[name][2].hedge_delay(self.percentile) if hedge and queue else None
+            done, _ = wait(pending, timeout=deadline, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主请求超过耗时分位数仍未返回：向次优数据源发出对冲请求，之后等待任一请求结束
+                hedge_name = queue.pop(0)
+                pending[self._submit(hedge_name, args, kwargs)] = hedge_name
+                deadline = None
+                with self._lock:
+                    self.hedged += 1
+                metrics.incr("provider.hedged")
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if name == hedge_name:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    metrics.incr("provider.hedge_won")
+                return result  # 仍在进行的请求在后台结束，其耗时照常计入统计
+            if queue and not pending:
+                with self._lock:
+                    self.failovers += 1
+                metrics.incr("provider.failover")
+        raise last_error
+
+    def stats(self):
+        """各数据源的健康状况（按当前评分排序）及对冲、故障切换次数"""
+        with self._lock:
+            summary = {"hedged": self.hedged, "hedge_wins": self.hedge_wins, "failovers": self.failovers}
+        providers = []
+        for name in sorted(self.providers, key=lambda n: self.providers[n][2].score()):
+            stats = self.providers[name][2]
+            providers.append({"provider": name, "score": stats.score(), **stats.snapshot()})
+        return {"registry": self.name, **summary, "providers": providers}
+
+
+def provider_stats():
+    """全部注册表的数据源统计，供监控/页面展示"""
+    with _lock:
+        registries = list(_registries.values())
+    return [registry.stats() for registry in registries]
+
+
+if __name__ == '__main__':
+    # 模拟：主数据源 5% 的请求卡顿 1.5 s，备用源稳定 0.15 s；对比不对冲与对冲的尾部耗时
+    import random
+
+    def flaky(x):
+        time.sleep(1.5 if random.random() < 0.05 else 0.05)
+        return x
+
+    def steady(x):
+        time.sleep(0.15)
+        return x
+
+    def broken(x):
+        raise ConnectionError("模拟连接失败")
+
+    for hedge in (False, True):
+        registry = ProviderRegistry(f"demo_hedge_{hedge}", hedge=hedge)
+        registry.register("flaky", flaky)
+        registry.register("steady", steady)
+        for _ in range(HEDGE_MIN_SAMPLES):  # 预热耗时样本
+            registry.providers["flaky"][2].record(0.05)
+        elapsed = []
+        for i in range(100):
+            t0 = time.perf_counter()
+            registry.call(i)
+            elapsed.append(time.perf_counter() - t0)
+        elapsed.sort()
+        print(f"对冲={hedge}: p50 {elapsed[50] * 1000:.0f} ms，p95 {elapsed[95] * 1000:.0f} ms，"
+              f"最大 {elapsed[-1] * 1000:.0f} ms，总计 {sum(elapsed):.1f} s")
+
+    registry = ProviderRegistry("demo_failover")
+    registry.register("broken", broken)
+    registry.register("steady", steady)
+    for i in range(5):
+        registry.call(i)
+    print("故障数据源被降级后的顺序：", registry.candidates())
+    for stats in provider_stats():
+        print(stats["registry"], {k: stats[k] for k in ("hedged", "hedge_wins", "failovers")},
+              [(p["provider"], p["calls"], p["failures"], p["p95_ms"] and round(p["p95_ms"])) for p in stats["providers"]])
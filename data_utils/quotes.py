@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from data_utils import metrics
+from data_utils.Ashare import get_realtime_quotes
+from data_utils.utils import get_fund_latest_nav
+
+QUOTE_TIMEOUT = 8    # 整批行情的等待上限（秒），超时未返回的标的按失败处理
+MAX_WORKERS = 16     # 并发请求数上限
+
+# 逐个代码取价：接收代码，返回含 close 列的 DataFrame（如 get_price / get_fund_price 的包装）
+DEFAULT_FETCHERS = {}
+
+# 批量取价：接收代码元组，返回以代码为索引、含 price 列的 DataFrame（一个任务取回全部代码）
+DEFAULT_BATCH_FETCHERS = {
+    "etf": get_realtime_quotes,
+    "fund": get_fund_latest_nav,
+}
+
+
+def quote_key(source, code):
+    """行情缓存键，如 "etf:sh510300" """
+    return f"{source}:{code}"
+
+
+def fetch_latest_prices(assets_info, fetchers=None, batch_fetchers=None, cache=None,
+                        timeout=QUOTE_TIMEOUT, max_workers=MAX_WORKERS):
+    """
+    并发获取全部持仓的最新价格
+    assets_info: 用户持仓配置 {名称: {"code", "type", ...}}，cash 类型不取价
+    fetchers: {类型: 逐个代码取价函数}，默认见 DEFAULT_FETCHERS
+    batch_fetchers: {类型: 批量取价函数}，同类型的全部代码合并为一个任务，默认见 DEFAULT_BATCH_FETCHERS
+    cache: 可选的 QuoteCache，命中（含过期待刷新的旧值）时不发请求
+    timeout: 整批等待上限（秒），页面耗时取决于最慢的一个请求而非所有请求之和
+    返回 (prices, errors)：
+        prices  {名称: 最新价}，只包含成功取到价格的标的
+        errors  {名称: 失败原因}，部分失败不影响其余标的的结果
+    """
+    fetchers = DEFAULT_FETCHERS if fetchers is None else fetchers
+    batch_fetchers = DEFAULT_BATCH_FETCHERS if batch_fetchers is None else batch_fetchers
+
+    # 同一代码只请求一次（多个持仓可能指向同一标的）
+    holders = {}
+    for name, info in assets_info.items():
+        source = info.get("type")
+        if source in batch_fetchers or source in fetchers:
+            holders.setdefault(quote_key(source, info["code"]), []).append(name)
+
+    prices, errors = {}, {}
+    if not holders:
+        return prices, errors
+
+    # 每个任务对应一组缓存键：批量类型一组一个任务，其余每个代码一个任务
+    tasks = {}
+    for key in holders:
+        source = key.split(":", 1)[0]
+        if source in batch_fetchers:
+            tasks.setdefault(source, []).append(key)
+        else:
+            tasks[key] = [key]
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(tasks)))
+    try:
+        futures = {}
+        for keys in tasks.values():
+            source = keys[0].split(":", 1)[0]
+            if source in batch_fetchers:
+                loader = _batch_loader(batch_fetchers[source])
+            else:
+                loader = _single_loader(fetchers[source])
+            # 请求计数记到发起方的页面运行
+            if cache is not None:
+                future = pool.submit(metrics.run_in_context(cache.get_many), keys, loader, timeout)
+            else:
+                future = pool.submit(metrics.run_in_context(_load_all), keys, loader)
+            futures[future] = keys
+
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            try:
+                values, failures = future.result()
+            except Exception as e:
+                values, failures = {}, {key: e for key in futures[future]}
+            for key in futures[future]:
+                for name in holders[key]:
+                    if key in values:
+                        prices[name] = values[key]
+                    else:
+                        errors[name] = failures.get(key, ValueError("未返回行情数据"))
+        for future in not_done:
+            for key in futures[future]:
+                for name in holders[key]:
+                    errors[name] = TimeoutError(f"行情请求超过 {timeout} 秒未返回")
+    finally:
+        # 不等待超时的请求，页面先用已返回的部分结果渲染
+        pool.shutdown(wait=False, cancel_futures=True)
+    return prices, errors
+
+
+def _single_loader(fetcher):
+    """逐个代码取价的加载函数，返回 {缓存键: 最新价}"""
+    def load(keys):
+        result = {}
+        for key in keys:
+            df = fetcher(key.split(":", 1)[1])
+            if df is not None and not df.empty:
+                result[key] = float(df["close"].iloc[-1])
+        return result
+    return load
+
+
+def _batch_loader(fetcher):
+    """批量取价的加载函数，返回 {缓存键: 最新价}，缺失的代码不出现在结果中"""
+    def load(keys):
+        codes = {key.split(":", 1)[1]: key for key in keys}
+        df = fetcher(tuple(codes))
+        return {key: float(df.loc[code, "price"]) for code, key in codes.items() if code in df.index}
+    return load
+
+
+def _load_all(keys, loader):
+    """不使用缓存时直接加载，返回值与 QuoteCache.get_many 一致"""
+    values = loader(keys)
+    return values, {}
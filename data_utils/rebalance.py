@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+REBALANCE_THRESHOLD = 0.2        # 相对偏差达到目标比例的20%才调仓
+EXCLUDED_CATEGORIES = ("机动-现金",)  # 不参与调仓的小类
+ETF_LOT = 100                    # 场内标的按100份整数倍交易
+FUND_DECIMALS = 2                # 场外标的份额精确到小数点后2位
+
+TYPE_CODES = {"cash": 0, "etf": 1, "fund": 2}
+
+
+def compute_orders(cat_idx, types, shares, values, targets, threshold=REBALANCE_THRESHOLD, skip=None):
+    """
+    再平衡计算核心（纯 NumPy，不含循环）
+    cat_idx: 每个标的所属小类在 targets 中的下标，不在目标配置中的小类为 -1
+    types: 每个标的的类型编码（见 TYPE_CODES）
+    shares: 每个标的的持有份额
+    values: 每个标的的现有价值
+    targets: 每个小类的目标比例
+    threshold: 相对偏差阈值 |目标-当前|/目标
+    shares/values 可以是 (..., 标的数) 的多维数组（如回测的多个日期、模拟的多条路径），按最后一维逐行计算，
+    此时 threshold 也可以是形如 (..., 1) 的数组；返回值相应多出前面的维度
+    skip: 每个小类是否跳过调仓（bool 数组），默认都不跳过
+    返回 dict：
+        current    各小类当前比例
+        diff_ratio 各小类比例偏差（目标-当前，正数需增持）
+        diff_value 各小类价值偏差（元）
+        deviation  各小类偏差百分比
+        rebalance  各小类是否需要调仓
+        unit_value 各标的单位净值
+        adjust     各标的建议调整份额（正数增持，负数减持）
+    """
+    cat_idx = np.asarray(cat_idx, dtype=np.int64)
+    types = np.asarray(types)
+    shares = np.asarray(shares, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    n_cat = len(targets)
+    skip = np.zeros(n_cat, dtype=bool) if skip is None else np.asarray(skip, dtype=bool)
+
+    # 最后一格收纳不在目标配置中的标的
+    slot = np.where(cat_idx >= 0, cat_idx, n_cat)
+    if values.ndim == 1:
+        total_value = values.sum()
+        category_value = np.bincount(slot, weights=values, minlength=n_cat + 1)[:n_cat]
+    else:
+        total_value = values.sum(axis=-1, keepdims=True)
+        onehot = np.zeros((len(slot), n_cat + 1))
+        onehot[np.arange(len(slot)), slot] = 1.0
+        category_value = (values @ onehot)[..., :n_cat]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        current = np.where(total_value != 0, category_value / total_value, 0.0)
+        diff_ratio = targets - current
+        diff_value = total_value * diff_ratio
+        deviation = np.where(targets > 0, np.abs(diff_ratio) / targets, 1.0)
+        rebalance = (deviation >= threshold) & ~skip
+
+        # 小类内按现有价值分摊价值偏差
+        in_target = cat_idx >= 0
+        safe_idx = np.where(in_target, cat_idx, 0)
+        active = in_target & rebalance[..., safe_idx]
+        asset_adjust_value = diff_value[..., safe_idx] * values / category_value[..., safe_idx]
+        unit_value = np.where(shares > 0, values / shares, 1.0)
+        base = np.where(active & (unit_value > 0), asset_adjust_value / unit_value, 0.0)
+    base = np.nan_to_num(base, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # 场内：增持向下取整到整手，减持向零取整到整手，且不超过当前持有（不卖空）
+    lots = np.floor(base / ETF_LOT)
+    etf = np.where(base > 0, lots * ETF_LOT, np.where(base < 0, (lots + 1) * ETF_LOT, 0.0))
+    etf = np.where((base < 0) & (np.abs(etf) > shares), -np.floor(shares / ETF_LOT) * ETF_LOT, etf)
+
+    # 场外：精确到0.01份，减持同样不超过当前持有
+    fund = np.round(base, FUND_DECIMALS)
+    fund = np.where((base < 0) & (np.abs(fund) > shares), -np.round(shares, FUND_DECIMALS), fund)
+
+    adjust = np.select([types == TYPE_CODES["etf"], types == TYPE_CODES["fund"]], [etf, fund], 0.0)
+    return {
+        "current": current,
+        "diff_ratio": diff_ratio,
+        "diff_value": diff_value,
+        "deviation": deviation,
+        "rebalance": rebalance,
+        "unit_value": unit_value,
+        "adjust": adjust + 0.0,  # 去掉 -0.0
+    }
+
+
+def rebalance_plan(df, target_ratio_sub, threshold=REBALANCE_THRESHOLD, excluded=EXCLUDED_CATEGORIES):
+    """
+    生成调仓建议表
+    df: 资产明细，索引为标的名称，含「类型」「持有份额」「分类」「现有价值」列
+    target_ratio_sub: {小类全名: 目标比例}
+    返回 (category_table, order_table)：
+        category_table 以小类为索引（不含 excluded），列为 目标比例/当前比例/比例偏差/价值偏差/偏差百分比/需调仓
+        order_table    需调整的标的，列为 分类/类型/持有份额/单位净值/调整份额/调整价值
+    """
+    categories = list(target_ratio_sub)
+    cat_idx = pd.Index(categories).get_indexer(df["分类"])
+    types = df["类型"].map(TYPE_CODES).fillna(-1).to_numpy()
+    result = compute_orders(
+        cat_idx, types, df["持有份额"].to_numpy(), df["现有价值"].to_numpy(),
+        [target_ratio_sub[k] for k in categories], threshold,
+        skip=[k in excluded for k in categories],
+    )
+
+    category_table = pd.DataFrame({
+        "目标比例": [target_ratio_sub[k] for k in categories],
+        "当前比例": result["current"],
+        "比例偏差": result["diff_ratio"],
+        "价值偏差": result["diff_value"],
+        "偏差百分比": result["deviation"],
+        "需调仓": result["rebalance"],
+    }, index=pd.Index(categories, name="分类"))
+    category_table = category_table[~category_table.index.isin(excluded)]
+
+    order_table = pd.DataFrame({
+        "分类": df["分类"].to_numpy(),
+        "类型": df["类型"].to_numpy(),
+        "持有份额": df["持有份额"].to_numpy(dtype=np.float64),
+        "单位净值": result["unit_value"],
+        "调整份额": result["adjust"],
+    }, index=df.index)
+    order_table["调整价值"] = order_table["调整份额"] * order_table["单位净值"]
+    order_table = order_table[order_table["调整份额"] != 0]
+    return category_table, order_table
+
+
+if __name__ == '__main__':
+    # 基准测试：与页面原先逐个小类、逐个标的的循环实现对比
+    import timeit
+
+    def rebalance_loop(df, target_ratio_sub):
+        total_value = df["现有价值"].sum()
+        category_value = df.groupby("分类")["现有价值"].sum().to_dict()
+        current_ratio = {k: v / total_value for k, v in category_value.items()}
+        adjustment = {}
+        for category in target_ratio_sub:
+            if category == "机动-现金":
+                continue
+            target = target_ratio_sub[category]
+            diff_ratio = target - current_ratio.get(category, 0.0)
+            deviation_pct = abs(diff_ratio) / target if target > 0 else 1.0
+            adjustment[category] = {"价值偏差": total_value * diff_ratio, "偏差百分比": deviation_pct}
+        significant_adj = {k: v for k, v in adjustment.items() if v["偏差百分比"] >= 0.2}
+        orders = {}
+        np.seterr(all="ignore")  # 与页面一致：小类现有价值为0时除零得到 NaN，不产生调仓
+        for category, adj in significant_adj.items():
+            category_assets = df[df["分类"] == category].index.tolist()
+            category_total = df.loc[category_assets, "现有价值"].sum()
+            for asset_name in category_assets:
+                asset_type = df.loc[asset_name, "类型"]
+                current_shares = df.loc[asset_name, "持有份额"]
+                unit_value = df.loc[asset_name, "现有价值"] / current_shares if current_shares > 0 else 1.0
+                asset_adjust_value = adj["价值偏差"] * (df.loc[asset_name, "现有价值"] / category_total)
+                adjust_shares = 0
+                if unit_value > 0:
+                    base_shares = asset_adjust_value / unit_value
+                    if asset_type == "etf":
+                        if base_shares > 0:
+                            adjust_shares = (base_shares // 100) * 100
+                        elif base_shares < 0:
+                            adjust_shares = (base_shares // 100 + 1) * 100
+                            if abs(adjust_shares) > current_shares:
+                                adjust_shares = -((current_shares // 100) * 100)
+                    elif asset_type == "fund":
+                        if base_shares > 0:
+                            adjust_shares = round(base_shares, 2)
+                        elif base_shares < 0:
+                            adjust_shares = round(base_shares, 2)
+                            if abs(adjust_shares) > current_shares:
+                                adjust_shares = -round(current_shares, 2)
+                if adjust_shares != 0:
+                    orders[asset_name] = adjust_shares
+        return orders
+
+    rng = np.random.default_rng(0)
+    for n_assets, n_cats in ((30, 8), (1000, 40), (5000, 100)):
+        categories = [f"大类{i % 5}-小类{i}" for i in range(n_cats)] + ["机动-现金"]
+        weights = rng.dirichlet(np.ones(len(categories)))
+        target_ratio_sub = dict(zip(categories, weights))
+        shares = rng.integers(0, 50, n_assets) * 100.0
+        prices = rng.uniform(0.5, 5, n_assets)
+        df = pd.DataFrame({
+            "类型": rng.choice(["etf", "fund", "cash"], n_assets, p=[0.5, 0.45, 0.05]),
+            "持有份额": shares,
+            "分类": rng.choice(categories, n_assets),
+            "现有价值": shares * prices,
+        }, index=[f"标的{i}" for i in range(n_assets)])
+
+        expected = rebalance_loop(df, target_ratio_sub)
+        _, orders = rebalance_plan(df, target_ratio_sub)
+        assert expected.keys() == set(orders.index)
+        assert np.allclose([expected[k] for k in orders.index], orders["调整份额"])
+
+        number = 3 if n_assets > 1000 else 10
+        t_loop = min(timeit.repeat(lambda: rebalance_loop(df, target_ratio_sub), number=number, repeat=3)) / number
+        t_vec = min(timeit.repeat(lambda: rebalance_plan(df, target_ratio_sub), number=number, repeat=3)) / number
+        print(f"{n_assets} 个标的 / {n_cats} 个小类: 循环 {t_loop * 1000:.1f} ms, 向量化 {t_vec * 1000:.2f} ms, {t_loop / t_vec:.0f}x")
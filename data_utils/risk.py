@@ -0,0 +1,289 @@
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_utils.portfolio_history import TRADING_DAYS_PER_YEAR, build_history, ffill_limited
+from data_utils.trading_calendar import default_calendar
+
+EWMA_LAMBDA = 0.94         # RiskMetrics 日度衰减系数，半衰期约 11 个交易日
+WINDOWS = (20, 60)         # 滚动波动率窗口（交易日）
+MAX_STATES = 64            # 进程内保留的风险状态数（按代码集合/分类配置），LRU 淘汰
+STAT_COLUMNS = ["近20日波动率", "近60日波动率", "EWMA波动率", "全样本波动率", "最大回撤", "当前回撤"]
+
+
+@dataclass(frozen=True)
+class RiskReport:
+    """
+    某一组序列（各标的或各大类）的风险指标，波动率均已年化
+    stats        每列一行，列见 STAT_COLUMNS
+    covariance   EWMA 协方差矩阵（年化）
+    correlation  EWMA 相关系数矩阵
+    sample_covariance  全样本协方差矩阵（年化，Welford 累计）
+    mean_return  全样本日收益率均值（年化，算术）
+    as_of        最后一根K线的日期
+    observations 收益率样本数
+    """
+    stats: pd.DataFrame
+    covariance: pd.DataFrame
+    correlation: pd.DataFrame
+    sample_covariance: pd.DataFrame
+    mean_return: pd.Series
+    as_of: object
+    observations: int
+
+
+class RiskState:
+    """
+    流式风险状态：每来一批新的日线只处理这批数据，不重算整个窗口
+    - 全样本均值/协方差：Welford 算法（批量合并用 Chan 公式）
+    - EWMA 协方差（RiskMetrics，不减均值）：S = λ^n·S + (1-λ)·Σ λ^(n-1-i)·r_i·r_iᵀ
+    - 滚动波动率：只保留最长窗口的最近收益率
+    - 回撤：记录历史最高价与最大回撤
+    价格缺失时沿用前值（收益率为 0），与组合历史的向前填充一致
+    """
+
+    def __init__(self, columns, windows=WINDOWS, lam=EWMA_LAMBDA):
+        n = len(columns)
+        self.columns = list(columns)
+        self.windows = tuple(windows)
+        self.lam = lam
+        self.first_date = None
+        self.last_date = None
+        self.last_price = np.full(n, np.nan)
+        self.count = 0
+        self.mean = np.zeros(n)
+        self.comoment = np.zeros((n, n))
+        self.ewma_cov = np.zeros((n, n))
+        self.ewma_weight = 0.0  # Σ(1-λ)λ^i，用于样本较少时的偏差修正
+        self.recent = np.empty((0, n))
+        self.peak = np.full(n, np.nan)
+        self.max_drawdown = np.zeros(n)
+        self.drawdown = np.zeros(n)
+        self._report = None
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def update(self, dates, prices):
+        """追加一批日线（日期须晚于 last_date）；prices: (行数, 列数) 的收盘价，NaN 表示缺价"""
+        prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+        if not len(prices):
+            return self
+        filled = ffill_limited(np.vstack([self.last_price, prices]), None)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.nan_to_num(filled[1:] / filled[:-1] - 1, nan=0.0, posinf=0.0, neginf=0.0)
+        if self.last_date is None:
+            returns = returns[1:]  # 第一根K线没有前收盘价
+        self._add_returns(returns)
+
+        peaks = np.fmax.accumulate(np.vstack([self.peak, filled[1:]]), axis=0)[1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdowns = filled[1:] / peaks - 1
+        self.peak = peaks[-1]
+        self.drawdown = np.nan_to_num(drawdowns[-1], nan=0.0)
+        self.max_drawdown = np.fmin(self.max_drawdown, np.fmin.reduce(drawdowns, axis=0))
+        self.last_price = filled[-1]
+        self.first_date = dates[0] if self.first_date is None else self.first_date
+        self.last_date = dates[-1]
+        self._report = None
+        return self
+
+    def _add_returns(self, returns):
+        n_new = len(returns)
+        if not n_new:
+            return
+        batch_mean = returns.mean(axis=0)
+        centered = returns - batch_mean
+        total = self.count + n_new
+        delta = batch_mean - self.mean
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.count * n_new / total)
+        self.mean += delta * (n_new / total)
+        self.count = total
+
+        decay = self.lam ** np.arange(n_new - 1, -1, -1)
+        self.ewma_cov = self.lam ** n_new * self.ewma_cov + (1 - self.lam) * (returns * decay[:, None]).T @ returns
+        self.ewma_weight = self.lam ** n_new * self.ewma_weight + (1 - self.lam) * decay.sum()
+        self.recent = np.vstack([self.recent, returns])[-max(self.windows):]
+
+    def report(self):
+        """当前的风险指标（两次 update 之间重复调用直接返回上次的结果）"""
+        if self._report is None:
+            self._report = self._build_report()
+        return self._report
+
+    def _build_report(self):
+        scale = TRADING_DAYS_PER_YEAR
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ewma_cov = self.ewma_cov / self.ewma_weight if self.ewma_weight else np.full_like(self.ewma_cov, np.nan)
+            sample_cov = self.comoment / (self.count - 1) if self.count > 1 else np.full_like(self.comoment, np.nan)
+            ewma_vol = np.sqrt(np.diag(ewma_cov))
+            correlation = ewma_cov / np.outer(ewma_vol, ewma_vol)
+        rolling = [
+            self.recent[-w:].std(axis=0, ddof=1) if len(self.recent) >= w else np.full(len(self.columns), np.nan)
+            for w in self.windows
+        ]
+        stats = pd.DataFrame(
+            np.column_stack(
+                [v * np.sqrt(scale) for v in rolling]
+                + [ewma_vol * np.sqrt(scale), np.sqrt(np.diag(sample_cov) * scale), self.max_drawdown, self.drawdown]
+            ),
+            index=pd.Index(self.columns),
+            columns=[f"近{w}日波动率" for w in self.windows] + STAT_COLUMNS[len(WINDOWS):],
+        )
+        frame = lambda m: pd.DataFrame(m, index=self.columns, columns=self.columns)
+        return RiskReport(
+            stats=stats,
+            covariance=frame(ewma_cov * scale),
+            correlation=frame(correlation),
+            sample_covariance=frame(sample_cov * scale),
+            mean_return=pd.Series(self.mean * scale if self.count else np.nan, index=self.columns),
+            as_of=self.last_date,
+            observations=self.count,
+        )
+
+
+_states = OrderedDict()  # 键 -> RiskState
+_lock = threading.Lock()
+
+
+def _settled(dates, now=None, calendar=None):
+    """已收盘、不会再变化的K线：日期早于今天，或今天已收盘（盘中的当日K线只临时计入）"""
+    calendar = calendar or default_calendar()
+    now = now or calendar.now()
+    close = datetime.combine(now.date(), calendar.sessions[-1][1], tzinfo=calendar.tz)
+    today = pd.Timestamp(now.date())
+    return (dates < today) | ((dates == today) & (now >= close))
+
+
+def _trim_unlisted(frame):
+    """
+    去掉没有任何价格的列，并从每列都已有价格的第一天开始（同 portfolio_history.unit_prices 的 trim）：
+    上市前的缺价若按 0 收益计入，会低估全样本波动率与协方差
+    """
+    frame = frame.dropna(axis=1, how="all")
+    if frame.empty:
+        return frame
+    listed = np.maximum.accumulate(frame.notna().to_numpy(), axis=0).all(axis=1)
+    return frame.iloc[int(np.argmax(listed)):]
+
+
+def risk_report(key, frame, now=None):
+    """
+    按 key 缓存的增量风险指标
+    frame: 日期 × 列 的价格（或价值）序列，先按 _trim_unlisted 去掉上市前的区间；
+           同一 key 再次调用时只把上次之后新增的日线并入状态，盘中尚未收盘的当日K线在状态的副本上临时计入，不写入状态
+    样本起点固定为状态建立时的第一天：load_prices 的窗口每天向后滚动一根K线，只要与状态衔接就继续累计，不因起点后移重建；
+    列不同、frame 比状态起点更早或与状态之间有缺口时重建。不同的样本区间应使用不同的 key
+    """
+    frame = _trim_unlisted(frame)
+    dates = pd.DatetimeIndex(frame.index)
+    with _lock:
+        state = _states.get(key)
+        if state is not None:
+            _states.move_to_end(key)
+    if state is None or state.columns != list(frame.columns) or (
+        state.first_date is not None and len(dates) and (dates[0] < state.first_date or dates[0] > state.last_date)
+    ):
+        state = RiskState(frame.columns)
+
+    with _lock:
+        values = frame.to_numpy(dtype=np.float64)
+        settled = _settled(dates, now)
+        new = settled if state.last_date is None else settled & (dates > state.last_date)
+        if new.any():
+            state.update(dates[new], values[new])
+        _states[key] = state
+        _states.move_to_end(key)
+        while len(_states) > MAX_STATES:
+            _states.popitem(last=False)
+
+        pending = ~settled
+        if state.last_date is not None:
+            pending &= dates > state.last_date
+        if pending.any():
+            return state.copy().update(dates[pending], values[pending]).report()
+        return state.report()
+
+
+def holding_risk(prices, now=None, window=None):
+    """
+    各标的的风险指标，按 (样本区间, 代码集合) 缓存
+    prices: 日期 × 代码，如 portfolio_history.load_prices 的结果；window: 样本区间（如年数），切换区间时各自累计
+    """
+    prices = prices[sorted(prices.columns)]
+    return risk_report(("holdings", window, tuple(prices.columns)), prices, now)
+
+
+def _category_risk(kind, labels, assets_info, prices, now=None, window=None):
+    """按 labels 汇总各标的每日价值后的风险指标，按 (样本区间, 代码, 类型, 份额, 分类) 缓存，份额或分类调整后重建"""
+    holdings = sorted((info["code"], info["type"], info["amount"], info["category"]) for info in assets_info.values())
+    key = (kind, window, hashlib.sha1(json.dumps(holdings, ensure_ascii=False).encode("utf-8")).hexdigest())
+    values = build_history(assets_info, prices).values
+    return risk_report(key, values.T.groupby(labels, sort=False).sum().T, now)
+
+
+def class_risk(assets_info, prices, now=None, window=None):
+    """各大类的风险指标：按当前份额回溯的各大类每日价值（见 portfolio_history.build_history）"""
+    majors = [str(info["category"]).split("-", 1)[0] for info in assets_info.values()]
+    return _category_risk("classes", majors, assets_info, prices, now, window)
+
+
+def sub_class_risk(assets_info, prices, now=None, window=None):
+    """各小类的风险指标：小类内各持仓按当前份额合成的每日价值，列为分类全名（大类-小类）"""
+    subs = [str(info["category"]) for info in assets_info.values()]
+    return _category_risk("subclasses", subs, assets_info, prices, now, window)
+
+
+def clear_risk_cache():
+    with _lock:
+        _states.clear()
+
+
+if __name__ == '__main__':
+    # 基准测试：100 个标的 5 年日线，首次建立状态 vs 每日新增一根K线的增量更新；并与 pandas 全量计算对比
+    # 增量更新时窗口整体后移一天（同 load_prices 的滚动窗口），检查走的是追加而不是重建
+    import time
+
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range(end="2026-09-30", periods=5 * TRADING_DAYS_PER_YEAR)
+    prices = pd.DataFrame(
+        np.exp(np.cumsum(rng.normal(0.0002, 0.01, (len(days), 100)), axis=0)),
+        index=days, columns=[f"sh51{i:04d}" for i in range(100)],
+    )
+    now = pd.Timestamp("2026-10-16 20:00", tz="Asia/Shanghai").to_pydatetime()
+
+    t0 = time.perf_counter()
+    report = holding_risk(prices.iloc[:-5], now)
+    print(f"首次建立（{len(days) - 5} 天 × 100 个标的）：{(time.perf_counter() - t0) * 1000:.1f} ms")
+    key = ("holdings", None, tuple(prices.columns))
+    for i in range(1, 6):
+        state, count = _states[key], _states[key].count
+        t0 = time.perf_counter()
+        report = holding_risk(prices.iloc[i:len(days) - 5 + i], now)
+        print(f"新增 1 根K线：{(time.perf_counter() - t0) * 1000:.2f} ms，"
+              f"追加到原状态：{_states[key] is state and _states[key].count == count + 1}")
+    t0 = time.perf_counter()
+    holding_risk(prices, now)
+    print(f"无新K线（直接返回缓存结果）：{(time.perf_counter() - t0) * 1000:.3f} ms")
+
+    t0 = time.perf_counter()
+    returns = prices.pct_change().iloc[1:]
+    full_vol = returns.std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    rolling_vol = returns.iloc[-20:].std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    returns.ewm(alpha=1 - EWMA_LAMBDA, adjust=True).cov()
+    drawdown = (prices / prices.cummax() - 1).min()
+    print(f"pandas 全量重算：{(time.perf_counter() - t0) * 1000:.1f} ms")
+    print("全样本波动率误差", float(np.abs(report.stats["全样本波动率"] - full_vol).max()))
+    print("20日波动率误差", float(np.abs(report.stats["近20日波动率"] - rolling_vol).max()))
+    # RiskMetrics 的 EWMA 协方差不减均值：与 pandas 对 r_i·r_j 做 EWMA 平均比较
+    products = pd.DataFrame(returns.iloc[:, 0].to_numpy()[:, None] * returns.to_numpy(), index=returns.index)
+    ewma_row = products.ewm(alpha=1 - EWMA_LAMBDA, adjust=True).mean().iloc[-1].to_numpy()
+    print("EWMA协方差误差", float(np.abs(report.covariance.to_numpy()[0] / TRADING_DAYS_PER_YEAR - ewma_row).max()))
+    print("最大回撤误差", float(np.abs(report.stats["最大回撤"] - drawdown).max()))
@@ -0,0 +1,206 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_utils.portfolio import flatten_categories
+from data_utils.portfolio_history import build_history
+from data_utils.rebalance import EXCLUDED_CATEGORIES, REBALANCE_THRESHOLD, TYPE_CODES, compute_orders
+
+CHUNK_PATHS = 5000       # 每批模拟的路径数，内存约为 批量 × 月数 × 8 字节
+MIN_OBSERVATIONS = 12    # 至少需要多少个月的历史收益率
+PERCENTILES = (5, 25, 50, 75, 95)
+METHODS = {"bootstrap": "历史月度收益重抽样", "normal": "多元对数正态"}
+
+
+@dataclass(frozen=True)
+class SimulationResult:
+    """
+    蒙特卡洛模拟结果
+    bands        各月组合价值的分位数，索引为月数，列为 PERCENTILES
+    finals       各路径期末价值
+    summary      汇总：期末分位数、亏损概率、年化收益中位数、平均调仓次数
+    categories   参与模拟的小类及目标比例（没有历史数据的小类已剔除并按比例放大其余小类）
+    dropped      因缺少历史数据被剔除的小类
+    """
+    bands: pd.DataFrame
+    finals: np.ndarray
+    summary: dict
+    categories: dict
+    dropped: list
+
+
+def category_returns(assets_info, prices):
+    """
+    各小类的历史月度收益率（按当前份额回溯各小类价值，取月末值计算）
+    prices: 日期 × 代码 的历史价格（如 portfolio_history.load_prices 的结果）
+    返回 DataFrame，索引为月份，列为小类全名；没有标的的小类不出现
+    """
+    history = build_history(assets_info, prices)
+    if history.values.empty:
+        return pd.DataFrame()
+    categories = [str(info["category"]) for info in assets_info.values()]
+    values = history.values.T.groupby(categories, sort=False).sum().T
+    monthly = values.groupby(values.index.to_period("M")).last()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = monthly.pct_change().iloc[1:]
+    return returns.replace([np.inf, -np.inf], np.nan).dropna(axis=1, how="any")
+
+
+def _normal_params(returns):
+    """对数收益率的均值与协方差的 Cholesky 因子（协方差非正定时截断负特征值）"""
+    logs = np.log1p(returns)
+    mean = logs.mean(axis=0)
+    cov = np.atleast_2d(np.cov(logs, rowvar=False))
+    vals, vecs = np.linalg.eigh(cov)
+    return mean, vecs * np.sqrt(np.clip(vals, 0, None))
+
+
+def simulate_chunk(seed, n_paths, months, targets, history, skip, settle, method="bootstrap",
+                   threshold=REBALANCE_THRESHOLD, rebalance_every=1, initial=1.0):
+    """
+    模拟一批路径（全部路径同时按月推进，逐月的计算都是 路径数 × 小类数 的数组运算）
+    targets: 各小类目标比例；history: 历史月度收益率 (月数, 小类数)
+    skip: 不参与调仓的小类（如 机动-现金）；settle: 买卖资金进出的小类下标，None 表示不单独结算
+    返回 (每月组合价值 (路径数, months + 1), 每条路径的调仓次数)
+    """
+    rng = np.random.default_rng(seed)
+    n_cat = len(targets)
+    cat_idx = np.arange(n_cat)
+    types = np.full(n_cat, TYPE_CODES["fund"])
+    values = np.tile(targets * initial, (n_paths, 1))
+    totals = np.empty((n_paths, months + 1))
+    totals[:, 0] = values.sum(axis=1)
+    rebalances = np.zeros(n_paths, dtype=np.int64)
+    if method == "normal":
+        mean, factor = _normal_params(history)
+
+    for month in range(1, months + 1):
+        if method == "normal":
+            growth = np.exp(mean + rng.standard_normal((n_paths, factor.shape[1])) @ factor.T)
+        else:
+            growth = 1.0 + history[rng.integers(0, len(history), n_paths)]
+        values *= growth
+
+        if month % rebalance_every == 0:
+            # 先按偏差筛出需要调仓的路径，只对这些路径套用页面的调仓规则（小类视为单位净值 1 的场外标的）
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weights = values / values.sum(axis=1, keepdims=True)
+                deviation = np.where(targets > 0, np.abs(targets - weights) / targets, 1.0)
+            rows = np.flatnonzero(((deviation >= threshold) & ~skip).any(axis=1))
+            if len(rows):
+                adjust = compute_orders(cat_idx, types, values[rows], values[rows], targets, threshold, skip)["adjust"]
+                if settle is not None:
+                    adjust[:, settle] -= adjust.sum(axis=1)
+                else:
+                    # 没有结算小类时，买卖净额按调仓后价值比例摊回参与交易的小类，每条路径的总价值不变
+                    traded = np.where(adjust != 0, values[rows] + adjust, 0.0)
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        share = np.nan_to_num(traded / traded.sum(axis=1, keepdims=True))
+                    adjust -= share * adjust.sum(axis=1, keepdims=True)
+                values[rows] += adjust
+                rebalances[rows] += adjust.any(axis=1)
+        totals[:, month] = values.sum(axis=1)
+    return totals, rebalances
+
+
+def _run_chunk(args):
+    return simulate_chunk(*args)
+
+
+def simulate(returns, categories, years=20, n_paths=10000, method="bootstrap", threshold=REBALANCE_THRESHOLD,
+             rebalance_every=1, initial=100000.0, cash_return=0.0, seed=None, chunk=CHUNK_PATHS,
+             max_workers=1, excluded=EXCLUDED_CATEGORIES):
+    """
+    按目标配置投资 initial 元，按月推进 years 年，每 rebalance_every 个月按阈值规则检查调仓
+    returns: category_returns 的结果（历史月度收益率）
+    method: "bootstrap" 按月整体重抽样历史收益（保留小类间的相关性）；"normal" 按多元对数正态分布抽样
+    cash_return: 不参与调仓的小类（现金）的年化收益率，它们没有历史收益率时使用
+    路径分批计算以限制内存；max_workers > 1 时各批分到进程池并行。每批的随机种子由 seed 派生，结果与进程数无关
+    进程池以 spawn 方式启动：在多线程的进程（如 Streamlit 服务）中 fork 可能死锁
+    """
+    _, target_ratio_sub = flatten_categories(categories)
+    dropped = [k for k in target_ratio_sub if k not in returns.columns and k not in excluded]
+    names = [k for k in target_ratio_sub if k not in dropped]
+    if len(returns) < MIN_OBSERVATIONS or not any(k in returns.columns for k in names):
+        raise ValueError(f"历史月度收益率不足 {MIN_OBSERVATIONS} 个月，无法模拟")
+    targets = np.array([target_ratio_sub[k] for k in names], dtype=np.float64)
+    targets = targets / targets.sum()
+    skip = np.array([k in excluded for k in names], dtype=bool)
+    cash_monthly = (1 + cash_return) ** (1 / 12) - 1
+    history = np.column_stack([
+        returns[k].to_numpy(dtype=np.float64) if k in returns.columns else np.full(len(returns), cash_monthly)
+        for k in names
+    ])
+    settle = int(np.flatnonzero(skip)[0]) if skip.any() else None
+
+    months = int(years * 12)
+    sizes = [min(chunk, n_paths - start) for start in range(0, n_paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [
+        (s, size, months, targets, history, skip, settle, method, threshold, rebalance_every, initial)
+        for s, size in zip(seeds, sizes)
+    ]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if max_workers <= 1:
+        results = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    totals = np.vstack([r[0] for r in results])
+    rebalances = np.concatenate([r[1] for r in results])
+
+    finals = totals[:, -1]
+    bands = pd.DataFrame(
+        np.percentile(totals, PERCENTILES, axis=0).T,
+        index=pd.RangeIndex(months + 1, name="月"), columns=list(PERCENTILES),
+    )
+    summary = {
+        **{f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(finals, PERCENTILES))},
+        "loss_probability": float((finals < initial).mean()),
+        "median_cagr": float((np.median(finals) / initial) ** (1 / years) - 1) if years else 0.0,
+        "mean_rebalances": float(rebalances.mean()),
+    }
+    return SimulationResult(
+        bands=bands,
+        finals=finals,
+        summary=summary,
+        categories=dict(zip(names, targets)),
+        dropped=dropped,
+    )
+
+
+if __name__ == '__main__':
+    # 基准测试：10000 条路径 × 20 年按月模拟，两种抽样方式；并检查结果与进程数无关
+    import time
+
+    rng = np.random.default_rng(0)
+    categories = {
+        "股票": {"ratio": 0.5, "subcategories": {"内地/沪深": 0.3, "全球/美股": 0.2}},
+        "债券": {"ratio": 0.4, "subcategories": {"利率/国债": 0.25, "信用/信用": 0.15}},
+        "机动": {"ratio": 0.1, "subcategories": {"现金": 0.1}},
+    }
+    months = pd.period_range("2021-10", periods=60, freq="M")
+    returns = pd.DataFrame({
+        "股票-内地/沪深": rng.normal(0.006, 0.05, 60),
+        "股票-全球/美股": rng.normal(0.008, 0.045, 60),
+        "债券-利率/国债": rng.normal(0.003, 0.008, 60),
+        "债券-信用/信用": rng.normal(0.004, 0.005, 60),
+    }, index=months)
+
+    for method in METHODS:
+        t0 = time.perf_counter()
+        result = simulate(returns, categories, years=20, n_paths=10000, method=method, seed=1, cash_return=0.015)
+        print(f"{method}: {time.perf_counter() - t0:.2f} s", {k: round(v, 3) for k, v in result.summary.items()})
+    serial = simulate(returns, categories, years=5, n_paths=5000, seed=2)
+    pooled = simulate(returns, categories, years=5, n_paths=5000, seed=2, max_workers=2)
+    print("进程池结果一致：", np.array_equal(serial.finals, pooled.finals))
+
+    # 没有现金时调仓只在小类之间转移价值：目标 5:3:2，涨幅 50%/10%/0%，只有第一、三个小类超过阈值，调仓后总价值仍为 128000
+    targets = np.array([0.5, 0.3, 0.2])
+    totals, rebalances = simulate_chunk(0, 1, 1, targets, np.array([[0.5, 0.1, 0.0]]), np.zeros(3, dtype=bool), None,
+                                        threshold=0.17, initial=100000.0)
+    print("调仓前后总价值不变：", np.isclose(totals[0, 1], 128000.0), "调仓次数", int(rebalances[0]))
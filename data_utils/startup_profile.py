@@ -0,0 +1,60 @@
+import ast
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["app.py", "pages/registration_page.py", "pages/show.py"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)")
+
+
+def page_imports(path, lazy=False):
+    """页面的导入语句：默认只取模块顶层（冷启动必付的开销），lazy=True 时包括函数/分支内的延迟导入"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    nodes = ast.walk(tree) if lazy else tree.body
+    return [ast.unparse(node) for node in nodes if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def import_times(statements, root=ROOT):
+    """
+    在新的解释器中执行导入语句并用 -X importtime 计时
+    返回 (总耗时秒, [(顶层模块, 累计耗时秒)]，按耗时降序)
+    """
+    code = "\n".join(statements) or "pass"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=root, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    packages = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        # 按顶层包汇总各模块自身耗时，pandas、matplotlib 等被间接导入的依赖也能单独看到
+        if m:
+            package = m.group(2).split(".")[0]
+            packages[package] = packages.get(package, 0) + int(m.group(1)) / 1e6
+    ranked = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)
+    return sum(packages.values()), ranked
+
+
+def report(top=8):
+    """逐个页面打印冷启动的导入耗时分解"""
+    for page in PAGES:
+        path = os.path.join(ROOT, page)
+        for lazy in (False, True):
+            if lazy and page != "pages/show.py":
+                continue
+            total, ranked = import_times(page_imports(path, lazy))
+            label = f"{page}（含登录后的延迟导入）" if lazy else page
+            print(f"{label}: {total * 1000:.0f} ms")
+            for package, seconds in ranked[:top]:
+                print(f"    {package:<20}{seconds * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    # 用法：python -m data_utils.startup_profile
+    report()
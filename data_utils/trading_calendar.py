@@ -0,0 +1,172 @@
+import logging
+import os
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+BEIJING_TZ = timezone(timedelta(hours=8))  # A股按北京时间交易（无夏令时）
+SESSIONS = ((dtime(9, 15), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))  # 上午含集合竞价，中午休市
+HOLIDAYS_FILE = os.environ.get(
+    "PORTFOLIO_HOLIDAYS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sse_holidays.txt")
+)
+
+BARS_PER_DAY = {'1m': 240, '5m': 48, '15m': 16, '30m': 8, '60m': 4}  # A股每天4小时交易
+
+logger = logging.getLogger(__name__)
+
+
+def load_holidays(path=HOLIDAYS_FILE):
+    """读取休市日文件（每行一个 YYYY-MM-DD，# 之后为注释），文件不存在时返回空集合"""
+    if not os.path.exists(path):
+        return frozenset()
+    days = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                days.add(date.fromisoformat(line))
+    return frozenset(days)
+
+
+class TradingCalendar:
+    """
+    沪深交易日历：周一至周五且不在休市日列表中的日期为交易日，交易时段见 SESSIONS
+    所有时间参数可以是 naive（按北京时间理解）或带时区的 datetime
+    covered_until 为休市日列表覆盖到的最后一天，默认取最后一个休市日所在年份的年末（交易所每年年底公布次年安排）；
+    查询更晚的日期时只能按周一至周五都开市处理，首次发生时记一条警告，并把该日期记在 beyond_coverage 上
+    """
+
+    def __init__(self, holidays=(), sessions=SESSIONS, tz=BEIJING_TZ, covered_until=None):
+        self.holidays = frozenset(holidays)
+        self.sessions = sessions
+        self.tz = tz
+        if covered_until is None and self.holidays:
+            covered_until = date(max(self.holidays).year, 12, 31)
+        self.covered_until = covered_until
+        self.beyond_coverage = None
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def _local(self, moment):
+        if moment is None:
+            return self.now()
+        if moment.tzinfo is None:
+            return moment.replace(tzinfo=self.tz)
+        return moment.astimezone(self.tz)
+
+    def is_trading_day(self, day):
+        if isinstance(day, datetime):
+            day = self._local(day).date()
+        if self.covered_until is None or day > self.covered_until:
+            self._flag_uncovered(day)
+        return day.weekday() < 5 and day not in self.holidays
+
+    def _flag_uncovered(self, day):
+        if self.beyond_coverage is not None:
+            return
+        self.beyond_coverage = day
+        coverage = f"只覆盖到 {self.covered_until}" if self.covered_until else "为空"
+        logger.warning("休市日列表%s，查询 %s 时节假日按交易日处理，行情缓存有效期和K线数可能不准，请更新 %s",
+                       coverage, day, HOLIDAYS_FILE)
+
+    def is_open(self, now=None):
+        """now 是否处于交易时段"""
+        now = self._local(now)
+        return self.is_trading_day(now.date()) and any(start <= now.time() < end for start, end in self.sessions)
+
+    def _session_bounds(self, day):
+        return [
+            (datetime.combine(day, start, tzinfo=self.tz), datetime.combine(day, end, tzinfo=self.tz))
+            for start, end in self.sessions
+        ]
+
+    def next_open(self, now=None):
+        """now 之后第一个交易时段的开始时刻（正处于交易时段时返回下一个时段的开始）"""
+        now = self._local(now)
+        day = now.date()
+        while True:
+            if self.is_trading_day(day):
+                for start, _ in self._session_bounds(day):
+                    if start > now:
+                        return start
+            day += timedelta(days=1)
+
+    def next_close(self, now=None):
+        """now 之后（含当天）第一个交易日的收盘时刻"""
+        now = self._local(now)
+        day = now.date()
+        while True:
+            if self.is_trading_day(day):
+                close = self._session_bounds(day)[-1][1]
+                if close > now:
+                    return close
+            day += timedelta(days=1)
+
+    def next_change(self, now=None):
+        """行情下一次可能变化的时刻：交易时段内为 now，否则为下一次开盘"""
+        now = self._local(now)
+        return now if self.is_open(now) else self.next_open(now)
+
+    def traded_between(self, since, until=None):
+        """(since, until] 内是否有交易时段，没有则这段时间内不可能产生新的行情或K线"""
+        since, until = self._local(since), self._local(until)
+        if until <= since:
+            return False
+        if self.is_open(since):
+            return True
+        return self.next_open(since) < until
+
+    def trading_days(self, start, end):
+        """(start, end] 内的交易日列表（日期）"""
+        if isinstance(start, datetime):
+            start = self._local(start).date()
+        if isinstance(end, datetime):
+            end = self._local(end).date()
+        days, day = [], start + timedelta(days=1)
+        while day <= end:
+            if self.is_trading_day(day):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def bars_between(self, last, now=None, frequency='1d'):
+        """
+        last 所在K线之后到 now 为止最多会有多少根新K线（不含 last 本身）
+        日线按交易日计，周线/月线按包含交易日的自然周/月计，分钟线按每天固定根数计（宁多勿少）
+        now 当天尚未开盘时不计当天
+        """
+        now = self._local(now)
+        end = now.date()
+        if self.is_trading_day(end) and now.time() < self.sessions[0][0]:
+            end -= timedelta(days=1)
+        days = self.trading_days(last, end)
+        if frequency == '1w':
+            last_week = self._local(last).isocalendar()[:2] if isinstance(last, datetime) else last.isocalendar()[:2]
+            return len({d.isocalendar()[:2] for d in days} - {last_week})
+        if frequency == '1M':
+            last_day = self._local(last).date() if isinstance(last, datetime) else last
+            return len({(d.year, d.month) for d in days} - {(last_day.year, last_day.month)})
+        if frequency in BARS_PER_DAY:
+            return (len(days) + 1) * BARS_PER_DAY[frequency]  # last 当天剩余的分钟线按整天估算
+        return len(days)
+
+
+_default_calendar = None
+
+
+def default_calendar():
+    """进程内共享的交易日历（休市日来自 HOLIDAYS_FILE）"""
+    global _default_calendar
+    if _default_calendar is None:
+        _default_calendar = TradingCalendar(load_holidays())
+    return _default_calendar
+
+
+if __name__ == '__main__':
+    cal = default_calendar()
+    now = cal.now()
+    print(f"现在 {now:%Y-%m-%d %H:%M}，{'交易中' if cal.is_open(now) else '休市'}")
+    print("下次开盘：", cal.next_open(now))
+    print("下次收盘：", cal.next_close(now))
+    print("2026年国庆后首个交易日：", cal.next_open(datetime(2026, 9, 30, 15, 0)))
+    print("休市日覆盖到：", cal.covered_until)
+    print("2025年交易日数：", len(cal.trading_days(date(2024, 12, 31), date(2025, 12, 31))))
@@ -1,29 +1,196 @@
-import requests
-import pandas as pd
+import json
 import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from data_utils import metrics
+from data_utils.net import http_get
+
+NAV_VAR = b"Data_netWorthTrend"   # pingzhongdata 中单位净值走势的变量名
+NAV_POINT = b'{'                   # 净值数组中每个点（扁平对象）的起始标记
+_NAV_FIELDS = re.compile(rb'"x":(\d+),"y":(-?[\d.]+(?:[eE][-+]?\d+)?)')
+_FUNDGZ = re.compile(r"jsonpgz\((.*)\)", re.S)
+NAV_MAX_LAG = 1           # 最新净值日期落后今天超过该工作日数即视为过期
 
-def get_fund_price(code, count=500):
+
+def get_fund_price(code, count=500, store=None):
     """
     获取场外基金净值数据（默认日频）
     code: 基金代码 (str)，如 "006961"
     frequency: 暂时只支持 "d" (日线)
     count: 返回最近 N 条记录
+    store: 可选的本地历史库 HistoryStore，覆盖所需区间时不发请求
     """
+    if store is not None:
+        return store.get(code, '1d', count, '', lambda n, e: get_fund_price(code, count=n))
+
     url = f"http://fund.eastmoney.com/pingzhongdata/{code}.js"
-    r = requests.get(url)
-    r.encoding = "utf-8"
+    r = http_get(url, stream=True)
+    try:
+        # 净值数组在文件前部，解析到数组结尾即停止下载，后面的累计净值等数据不再读取
+        nav_data = extract_nav_array(r.iter_content(chunk_size=16384))
+    finally:
+        r.close()
+
+    times, closes = parse_nav_points(nav_data, count)
+
+    # 格式化 DataFrame（保持与 get_price 接口一致）
+    df = pd.DataFrame({'close': closes}, index=nav_dates(times))
+    df.index.name = 'date'
+    return df
+
+
+def nav_dates(times):
+    """
+    东方财富净值点的时间戳（毫秒）转为不带时区的日期
+    时间戳是北京时间零点，直接按 UTC 解析会落在前一天 16:00，取日期后整体错后一天（周一的净值落到周日）
+    """
+    return pd.to_datetime(times, unit='ms', utc=True).tz_convert('Asia/Shanghai').tz_localize(None)
+
+
+def get_fund_latest_nav(codes, max_workers=8, max_lag=NAV_MAX_LAG):
+    """
+    批量获取场外基金最新单位净值（并发请求）
+    codes: 基金代码列表
+    max_lag: 轻量接口返回的净值日期落后今天超过 max_lag 个工作日时，改用 get_fund_price 的完整历史兜底
+    返回以基金代码为索引的 DataFrame：price 单位净值，date 净值日期，source 数据来源
+    获取失败的代码不出现在结果中
+    """
+    codes = list(dict.fromkeys(codes))
+    rows = []
+    if codes:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(codes))) as pool:
+            # 每个任务各自复制一份上下文：同一个 Context 不能被多个线程同时进入
+            futures = [pool.submit(metrics.run_in_context(_latest_nav), code, max_lag) for code in codes]
+            for future in futures:
+                row = future.result()
+                if row is not None:
+                    rows.append(row)
+    return pd.DataFrame(rows, columns=['code', 'price', 'date', 'source']).set_index('code')
 
-    # 提取净值数据
-    nav_data = re.search(r"Data_netWorthTrend\s*=\s*(.*?);", r.text).group(1)
-    df = pd.DataFrame(eval(nav_data))  # [{'x':时间戳,'y':净值,'equityReturn':日涨幅}, ...]
 
-    # 格式化 DataFrame
-    df['date'] = pd.to_datetime(df['x'], unit='ms')
-    df = df.set_index('date')
-    df = df.rename(columns={'y': 'close'})[['close']]  # 保持与 get_price 接口一致
+def _latest_nav(code, max_lag):
+    """单只基金最新净值：优先 fundgz 估值接口中的上一交易日净值，缺失或过期时读取完整历史"""
+    latest = None
+    try:
+        r = http_get(f"http://fundgz.1234567.com.cn/js/{code}.js")
+        match = _FUNDGZ.search(r.content.decode('utf-8'))
+        if match and match.group(1).strip():  # 无估值的基金返回 jsonpgz();
+            data = json.loads(match.group(1))
+            latest = [code, float(data['dwjz']), pd.Timestamp(data['jzrq']), 'fundgz']
+    except Exception:
+        latest = None
 
-    # 只取最近 count 条
+    today = datetime.now(timezone(timedelta(hours=8))).date()
+    if latest is not None and np.busday_count(latest[2].date(), today) <= max_lag:
+        return latest
+
+    try:
+        df = get_fund_price(code, count=1)
+    except Exception:
+        return latest  # 兜底也失败时，过期的净值总比没有好
+    if df.empty:
+        return latest
+    if latest is None or df.index[-1] > latest[2]:
+        latest = [code, float(df['close'].iloc[-1]), df.index[-1], 'pingzhongdata']
+    return latest
+
+
+def extract_nav_array(chunks):
+    """
+    从 pingzhongdata 的字节流中截取 Data_netWorthTrend 数组（含方括号）
+    chunks: 字节块迭代器，如 response.iter_content()；取到数组结尾后不再继续读取
+    """
+    buf = bytearray()
+    start = -1
+    scan_from = 0
+    for chunk in chunks:
+        buf += chunk
+        if start < 0:
+            var_pos = buf.find(NAV_VAR)
+            if var_pos < 0:
+                continue
+            start = buf.find(b"[", var_pos)
+            if start < 0:
+                continue
+            scan_from = start
+        end = buf.find(b"];", scan_from)
+        if end >= 0:
+            return bytes(buf[start:end + 1])
+        scan_from = max(start, len(buf) - 1)  # 结束标记可能跨越两个字节块
+    raise ValueError("未找到基金净值数据 Data_netWorthTrend")
+
+
+def parse_nav_points(nav_data, count=None):
+    """
+    解析净值数组，返回 (时间戳毫秒数组, 净值数组)
+    nav_data: extract_nav_array 的结果
+    count: 只解析最后 N 个点（从数组末尾向前定位，不解析更早的数据）；None 表示全部
+    """
+    body = nav_data
     if count is not None:
-        df = df.tail(count)
+        pos = len(nav_data)
+        for _ in range(count):
+            found = nav_data.rfind(NAV_POINT, 0, pos)
+            if found < 0:
+                break
+            pos = found
+        body = nav_data[pos:]
 
-    return df
+    fields = _NAV_FIELDS.findall(body)
+    if len(fields) == body.count(NAV_POINT):
+        pairs = np.array(fields, dtype=bytes).reshape(-1, 2)
+        return pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.float64)
+
+    # 字段顺序或格式与预期不符时退回 JSON 解析
+    points = json.loads(nav_data)
+    if count is not None:
+        points = points[-count:] if count else []
+    times = np.array([p["x"] for p in points], dtype=np.int64)
+    closes = np.array([p["y"] for p in points], dtype=np.float64)
+    return times, closes
+
+
+if __name__ == '__main__':
+    # 基准测试：与原先的「整文件正则 + eval + 构建完整 DataFrame」实现对比
+    import timeit
+
+    def get_fund_price_eval(text, count=500):
+        nav_data = re.search(r"Data_netWorthTrend\s*=\s*(.*?);", text).group(1)
+        df = pd.DataFrame(eval(nav_data))
+        df['date'] = nav_dates(df['x'].to_numpy())
+        df = df.set_index('date')
+        df = df.rename(columns={'y': 'close'})[['close']]
+        if count is not None:
+            df = df.tail(count)
+        return df
+
+    def get_fund_price_stream(payload, count=500, chunk_size=16384):
+        chunks = (payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size))
+        times, closes = parse_nav_points(extract_nav_array(chunks), count)
+        df = pd.DataFrame({'close': closes}, index=nav_dates(times))
+        df.index.name = 'date'
+        return df
+
+    # 构造与 pingzhongdata 结构相近的数据：约 5000 个净值点，后面跟着同样大小的累计净值等数组
+    # 时间戳与真实数据一样是北京时间零点（2010-01-01 起每天一个点）
+    n = 5000
+    points = [{"x": 1262275200000 + i * 86400000, "y": round(1 + i / 3000, 4),
+               "equityReturn": 0.1, "unitMoney": ""} for i in range(n)]
+    nav = json.dumps(points, separators=(",", ":"))
+    acc = json.dumps([[p["x"], p["y"]] for p in points], separators=(",", ":"))
+    text = (f'var fS_name = "示例基金";var fS_code = "000000";var Data_netWorthTrend = {nav};'
+            f'var Data_ACWorthTrend = {acc};var Data_grandTotal = {acc};')
+    payload = text.encode("utf-8")
+
+    assert get_fund_price_stream(payload, 1).index[0] == pd.Timestamp("2010-01-01") + pd.Timedelta(days=n - 1)
+    for count in (1, 500, None):
+        old = get_fund_price_eval(text, count)
+        new = get_fund_price_stream(payload, count)
+        assert old.index.equals(new.index) and np.allclose(old['close'], new['close'])
+        t_old = min(timeit.repeat(lambda: get_fund_price_eval(text, count), number=5, repeat=3)) / 5
+        t_new = min(timeit.repeat(lambda: get_fund_price_stream(payload, count), number=5, repeat=3)) / 5
+        print(f"count={count}: eval {t_old * 1000:.2f} ms, stream {t_new * 1000:.2f} ms, {t_old / t_new:.1f}x")
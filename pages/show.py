@@ -1,23 +1,21 @@
-import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from pymongo import MongoClient
 import bcrypt
 import uuid
 import hashlib
+import json
 import time
-from data_utils.Ashare import *
-from data_utils.utils import get_fund_price
+from data_utils import metrics
+from data_utils.auth import AuthBusy, token_cache, verify_password
+from data_utils.db import (
+    EXISTS_FIELDS, TOKEN_FIELDS, TOKEN_STATE_FIELDS, VersionConflict,
+    find_login_user, get_users_collection, merge_holdings, update_holdings,
+)
+# pandas / matplotlib / 行情模块只在登录后用到，在对应函数内导入，未登录时不加载
 
 st.set_page_config(page_title="资产组合查询器", layout="wide")
+run_metrics = metrics.start_run()  # 统计本次运行的数据库往返和行情请求次数
 
 # ========== 基础配置 ==========
-# 中文字体设置
-mpl.font_manager.fontManager.addfont('font/NotoSansSC-VariableFont_wght.ttf')
-plt.rcParams['font.sans-serif']=['Noto Sans SC']
-plt.rcParams['axes.unicode_minus']=False
-
 # 令牌配置（可自定义）
 TOKEN_EXPIRE_DAYS = 30  # 令牌有效期30天
 SECRET_KEY = st.secrets["secret_key"]["secret_key"]  # 加密密钥，建议替换为复杂随机字符串
@@ -25,14 +23,8 @@ BASE_URL = st.secrets["base_url"]["base_url"]
 # BASE_URL = "http://localhost:8501"
 # base_url = "https://portfoliochecker.streamlit.app"
 
-# MongoDB 连接
-@st.cache_resource
-def init_connection():
-    return MongoClient(st.secrets["mongo"]["conn_str"])
-
-client = init_connection()
-db = client["user_db"]
-users_collection = db["users"]
+# MongoDB 连接（各页面共用同一个客户端，首次使用时建立并确保索引）
+users_collection = get_users_collection(st.secrets["mongo"]["conn_str"])
 
 # 默认目标比例配置（首次使用时的初始值）
 DEFAULT_CATEGORIES = {
@@ -104,11 +96,17 @@ def save_token_to_user(username, token=None):
         {"username": username},
         {"$set": {"login_token": token, "token_expire": expire_time}}
     )
+    token_cache.invalidate_user(username)  # 旧令牌立即失效
+    remember_user_fields(username, login_token=token, token_expire=expire_time)
     return token, expire_time
 
 def verify_user_token(token):
+    # 先查进程内令牌缓存，命中则无需访问数据库
+    username = token_cache.get(token)
+    if username:
+        return username
     # 直接根据令牌查询用户（而非遍历所有用户）
-    user = users_collection.find_one({"login_token": token})
+    user = users_collection.find_one({"login_token": token}, TOKEN_FIELDS)
     if not user:
         st.warning("无效的登录令牌（未找到匹配用户）")
         return None
@@ -116,11 +114,12 @@ def verify_user_token(token):
     if time.time() > user.get("token_expire", 0):
         st.warning("登录令牌已过期，请重新获取")
         return None
+    token_cache.put(token, user["username"], user["token_expire"])
     return user["username"]
 
 def init_user_token(username):
     """为旧用户初始化令牌字段"""
-    user = users_collection.find_one({"username": username})
+    user = users_collection.find_one({"username": username}, TOKEN_STATE_FIELDS)
     if not user.get("login_token") or not user.get("token_expire"):
         token, expire_time = save_token_to_user(username)
         return token
@@ -136,16 +135,21 @@ def check_password():
         st.error("用户名/邮箱和密码不能为空")
         return
     
-    user = users_collection.find_one({"$or": [
-        {"username": input_username},
-        {"email": input_username}
-    ]})
+    user = find_login_user(users_collection, input_username)
     
     if not user:
         st.error("用户不存在，请检查用户名/邮箱")
         return
     
-    if bcrypt.checkpw(input_pwd.encode('utf-8'), user["password"]):
+    try:
+        verified = verify_password(
+            input_pwd, user["password"], username=user["username"], ip=st.context.ip_address
+        )
+    except AuthBusy as e:
+        st.error(str(e))
+        return
+
+    if verified:
         st.session_state.logged_in = True
         st.session_state.current_username = user["username"]
         # 🔴 为旧用户初始化令牌
@@ -158,7 +162,7 @@ def check_password():
 
 def register_user(username, password, email):
     """用户注册（用于给新用户初始化令牌，已有用户可手动执行一次）"""
-    if users_collection.find_one({"username": username}):
+    if users_collection.find_one({"username": username}, EXISTS_FIELDS):
         return False, "用户名已存在"
     # 密码加密存储
     hashed_pwd = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
@@ -170,7 +174,8 @@ def register_user(username, password, email):
         "email": email,
         "login_token": token,
         "token_expire": expire_time,
-        "assets_info": {}
+        "assets_info": {},
+        "assets_version": 0
     })
     return True, f"注册成功！您的一键登录URL：{BASE_URL}/show?token={token}"
 
@@ -189,32 +194,38 @@ def token_login():
             return True
     return False
 
+# 本次运行内的用户文档缓存：Streamlit 每次重跑都会重新执行本脚本，模块变量随之清空
+_run_cache = {}
+USER_DOC_FIELDS = {
+    "assets_info": 1, "assets_version": 1, "categories": 1, "login_token": 1, "token_expire": 1, "_id": 0
+}
+
+def get_user_doc():
+    """读取当前用户文档（本次运行内只查询一次数据库）"""
+    username = st.session_state.current_username
+    if _run_cache.get("username") != username:
+        _run_cache["user"] = users_collection.find_one({"username": username}, USER_DOC_FIELDS) or {}
+        _run_cache["username"] = username
+    return _run_cache["user"]
+
+def remember_user_fields(username, **fields):
+    """写库成功后同步本次运行内的缓存，后续读取无需再查数据库"""
+    if _run_cache.get("username") == username:
+        _run_cache["user"].update(fields)
+
 def get_user_config_from_db():
     """从数据库读取用户配置，若无则使用默认值"""
     if not st.session_state.current_username:
         return {}, DEFAULT_CATEGORIES
     
-    user = users_collection.find_one(
-        {"username": st.session_state.current_username},
-        {"assets_info": 1, "categories": 1, "_id": 0}
-    )
+    user = get_user_doc()
     
-    # 若无配置则使用默认值
+    # 若无配置则使用默认值（返回持仓的副本，调用方可直接修改）
     return (
-        user.get("assets_info", {}) if user else {},
-        user.get("categories", DEFAULT_CATEGORIES) if user else DEFAULT_CATEGORIES
+        dict(user.get("assets_info", {})),
+        user.get("categories", DEFAULT_CATEGORIES)
     )
 
-def flatten_categories(categories):
-    """将嵌套的分类结构展平为目标比例字典"""
-    target_ratio = {name: data["ratio"] for name, data in categories.items()}
-    target_ratio_sub = {}
-    for major_name, major_data in categories.items():
-        for minor_name, minor_ratio in major_data["subcategories"].items():
-            full_name = f"{major_name}-{minor_name}"
-            target_ratio_sub[full_name] = minor_ratio
-    return target_ratio, target_ratio_sub
-
 def save_categories_to_db(categories):
     """保存分类配置到数据库"""
     try:
@@ -226,6 +237,9 @@ def save_categories_to_db(categories):
         
         # 验证每个大类的小类比例总和等于大类比例
         for major_name, major_data in categories.items():
+            if major_data["ratio"] <= 0:
+                st.error(f"「{major_name}」的比例必须大于0，不需要的大类请删除")
+                return False
             total_minor = sum(major_data["subcategories"].values())
             if not (0.99 * major_data["ratio"] <= total_minor <= 1.01 * major_data["ratio"]):
                 st.error(
@@ -239,23 +253,45 @@ def save_categories_to_db(categories):
             {"username": st.session_state.current_username},
             {"$set": {"categories": categories}}
         )
+        remember_user_fields(st.session_state.current_username, categories=categories)
         st.success("分类配置保存成功！")
         return True
     except Exception as e:
         st.error(f"保存失败：{str(e)}")
         return False
 
+def remember_holdings_version():
+    """记下页面展示的持仓版本（持仓编辑区渲染完后调用），保存时据此检查期间是否被其他页面修改"""
+    username = st.session_state.current_username
+    st.session_state.holdings_version = (username, get_user_doc().get("assets_version"))
+
+def write_holdings(changes):
+    """
+    只写入变动的标的（$set/$unset 单个字段），并按页面展示时的版本号做乐观并发检查
+    （每次重跑都会重新读取用户文档，用它的版本号检查不出其他页面在此期间的修改）
+    changes: {标的名称: 标的信息}，标的信息为 None 表示删除
+    """
+    username = st.session_state.current_username
+    user = get_user_doc()
+    seen_username, version = st.session_state.get("holdings_version", (None, None))
+    if seen_username != username:
+        version = user.get("assets_version")
+    assets = user.get("assets_info", {})
+    version = update_holdings(users_collection, username, changes, version, assets)
+    remember_user_fields(username, assets_info=merge_holdings(assets, changes), assets_version=version)
+    st.session_state.holdings_version = (username, version)
+
+CONFLICT_MESSAGE = "持仓已在其他页面被修改，请刷新页面后重试"
+
 def add_asset_to_db(asset_data):
     """添加新标的到数据库"""
     try:
-        current_assets, _ = get_user_config_from_db()
-        updated_assets = {**current_assets, **asset_data}
-        users_collection.update_one(
-            {"username": st.session_state.current_username},
-            {"$set": {"assets_info": updated_assets}}
-        )
+        write_holdings(asset_data)
         st.success("标的添加成功！")
         return True
+    except VersionConflict:
+        st.error(f"添加失败：{CONFLICT_MESSAGE}")
+        return False
     except Exception as e:
         st.error(f"添加失败：{str(e)}")
         return False
@@ -263,17 +299,13 @@ def add_asset_to_db(asset_data):
 def update_asset_in_db(asset_data):
     """更新标的信息（主要用于调整持有数量）"""
     try:
-        # 获取当前资产配置
-        current_assets, _ = get_user_config_from_db()
-        # 合并更新数据（覆盖原有标的信息）
-        updated_assets = {** current_assets, **asset_data}
-        # 执行数据库更新
-        users_collection.update_one(
-            {"username": st.session_state.current_username},
-            {"$set": {"assets_info": updated_assets}}
-        )
+        # 只覆盖传入的标的，其余标的不随请求发送
+        write_holdings(asset_data)
         st.success("标的信息更新成功！")
         return True
+    except VersionConflict:
+        st.error(f"更新失败：{CONFLICT_MESSAGE}")
+        return False
     except Exception as e:
         st.error(f"更新失败：{str(e)}")
         return False
@@ -283,36 +315,38 @@ def delete_asset_from_db(asset_name):
     try:
         current_assets, _ = get_user_config_from_db()
         if asset_name in current_assets:
-            del current_assets[asset_name]
-            users_collection.update_one(
-                {"username": st.session_state.current_username},
-                {"$set": {"assets_info": current_assets}}
-            )
+            write_holdings({asset_name: None})
             st.success(f"标的「{asset_name}」删除成功！")
             return True
         else:
             st.error("标的不存在，删除失败")
             return False
+    except VersionConflict:
+        st.error(f"删除失败：{CONFLICT_MESSAGE}")
+        return False
     except Exception as e:
         st.error(f"删除失败：{str(e)}")
         return False
     
 # ========== 资产组合计算功能 ==========
-@st.cache_data(ttl=300)
-def get_price_cached(code):
-    return get_price(code, frequency="5m", count=1)
-
-@st.cache_data(ttl=300)
-def get_fund_price_cached(code):
-    return get_fund_price(code, count=1)
+QUOTE_CACHE_PATH = ".cache/quotes.sqlite"  # 行情缓存磁盘层，进程重启后仍可命中
 
-# @st.cache_data(ttl=5)
-# def calculate_portfolio_cached():
-#     return calculate_portfolio()
-
-def calculate_portfolio():
-    # 实时读取配置
-    assets_info, categories = get_user_config_from_db()
+@st.cache_resource
+def get_quote_cache():
+    """所有会话共享的行情缓存（缓存时间随交易时段变化，过期后先返回旧值再后台刷新）"""
+    from data_utils.cache import QuoteCache
+    return QuoteCache(db_path=QUOTE_CACHE_PATH)
+
+@st.cache_data(max_entries=100, show_spinner=False)
+def get_portfolio_snapshot(assets_info, categories, prices):
+    """按 (持仓, 分类配置, 价格) 缓存组合快照，无关控件触发的重跑不再重复计算"""
+    from data_utils.portfolio import build_snapshot
+    return build_snapshot(assets_info, categories, prices)
+
+def calculate_portfolio(assets_info, categories):
+    """计算并渲染组合（配置由调用方传入，本次运行内已读取过的配置不再查库）"""
+    from data_utils.cache import market_open, market_ttl
+    from data_utils.portfolio import flatten_categories
     target_ratio, target_ratio_sub = flatten_categories(categories)
 
     # 处理读取失败
@@ -324,135 +358,308 @@ def calculate_portfolio():
             st.rerun()
         st.stop()
 
-    # 获取现有价值
-    A = {}
+    if st.session_state.get("live_mode"):
+        # 实时模式：只重跑组合展示片段，持仓与分类编辑区不受影响
+        # 刷新间隔跟随交易时段：盘中为行情缓存时间，休市时一直等到下次开盘
+        is_open = market_open()
+        interval = market_ttl("etf:live")
+        st.fragment(run_every=interval)(show_portfolio)(assets_info, categories, is_open)
+        if not is_open:
+            st.caption("休市中，实时刷新已暂停，将在下次开盘时恢复")
+    else:
+        show_portfolio(assets_info, categories)
+    return assets_info, categories, target_ratio, target_ratio_sub
+
+def show_portfolio(assets_info, categories, live_open=None):
+    """
+    取价并渲染组合
+    实时模式下（live_open 为开始时的交易状态）只有缓存已过期的行情会重新请求，
+    并在上一次的快照上只重算价格变化的标的
+    """
+    from data_utils.cache import market_open
+    from data_utils.portfolio import update_snapshot
+    from data_utils.quotes import fetch_latest_prices
+
+    if live_open is not None and market_open() != live_open:
+        st.rerun(scope="app")  # 开盘/收盘切换时整页重跑以调整刷新间隔
+
+    # 获取现有价值（所有持仓并发取价，失败或超时的标的按0计价）
+    prices, errors = fetch_latest_prices(assets_info, cache=get_quote_cache())
+    for name, e in errors.items():
+        st.warning(f"获取 {name} 数据失败：{e}")
+
+    config_key = hashlib.sha1(
+        json.dumps([assets_info, categories], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    previous = st.session_state.get("live_snapshot")
+    if live_open is not None and previous and previous[0] == config_key:
+        snapshot = update_snapshot(previous[1], prices)
+    else:
+        snapshot = get_portfolio_snapshot(assets_info, categories, prices)
+    st.session_state.live_snapshot = (config_key, snapshot) if live_open is not None else None
+    render_portfolio(snapshot)
+
+def highlight_diff(row):
+    val = float(row["差额比例"][:-1])
+    if val > 20:
+        return ["background-color: #ff9999;"] * len(row)
+    elif 10 < val <= 20:
+        ratio = (val - 10) / 10
+        r, g, b = 255, int(230 - ratio * 77), int(230 - ratio * 77)
+        return [f"background-color: rgb({r},{g},{b});"] * len(row)
+    elif val < -20:
+        return ["background-color: #99ccff;"] * len(row)
+    elif -20 <= val < -10:
+        ratio = (abs(val) - 10) / 10
+        r, g, b = int(230 - ratio * 77), int(240 - ratio * 36), 255
+        return [f"background-color: rgb({r},{g},{b});"] * len(row)
+    else:
+        return [""] * len(row)
+
+def format_compare_table(table):
+    """目标对比表转为展示用字符串（金额保留两位小数，比例加百分号）"""
+    import pandas as pd
+    shown = pd.DataFrame(index=table.index)
+    for col in table.columns:
+        suffix = "%" if col.endswith("比例") else ""
+        shown[col] = [f"{round(v, 2):.2f}{suffix}" for v in table[col]]
+    return shown
+
+PIE_CHART_ENGINE = "image"  # "image"：服务端渲染并缓存图片；"vega-lite"：交给浏览器渲染
+
+def render_pie(summary):
+    """资产分布饼图（同样的分布只渲染一次）"""
+    from data_utils.charts import pie_image, pie_spec
+    if PIE_CHART_ENGINE == "vega-lite":
+        st.vega_lite_chart(spec=pie_spec(summary), use_container_width=True)
+    else:
+        st.image(pie_image(summary), width="stretch")
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner="正在读取历史行情…")
+def get_history_prices(assets_info, years):
+    """按 (持仓, 年数) 缓存对齐后的历史价格，K线另有本地历史库，过期后只补拉新增部分"""
+    from data_utils.history_store import default_store
+    from data_utils.portfolio_history import load_prices
+    return load_prices(assets_info, years=years, store=default_store())
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def get_portfolio_history(assets_info, years):
+    from data_utils.portfolio_history import build_history
+    return build_history(assets_info, get_history_prices(assets_info, years))
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner="正在回测…")
+def get_threshold_sweep(assets_info, categories, years, fee_rate):
+    """不同调仓阈值、检查频率下按页面规则回测的汇总指标"""
+    from data_utils.backtest import prepare, sweep
+    setup = prepare(assets_info, categories, get_history_prices(assets_info, years))
+    return sweep(setup, fee_rate=fee_rate, max_workers=1)  # 几十个组合在当前进程内只需零点几秒
+
+def show_risk(assets_info):
+    """各大类、各标的的波动率、回撤与相关性（按日线增量更新）"""
+    from data_utils.risk import class_risk, holding_risk
+    years = st.radio("样本区间", [1, 3, 5], index=2, horizontal=True, format_func=lambda y: f"近{y}年", key="risk_years")
+    prices = get_history_prices(assets_info, years)
+    if prices.empty:
+        st.info("暂无历史行情")
+        return
+    percent = {col: "{:.2%}" for col in ["近20日波动率", "近60日波动率", "EWMA波动率", "全样本波动率", "最大回撤", "当前回撤"]}
+
+    classes = class_risk(assets_info, prices, window=years)
+    st.markdown("**大类**")
+    st.dataframe(classes.stats.style.format(percent, na_rep="-"), use_container_width=True)
+    st.markdown("**大类相关系数（EWMA）**")
+    st.dataframe(classes.correlation.style.format("{:.2f}", na_rep="-"), use_container_width=True)
+
+    holdings = holding_risk(prices, window=years)
+    names = {}
     for name, info in assets_info.items():
+        names.setdefault(info["code"], []).append(name)
+    stats = holdings.stats.rename(index=lambda code: "、".join(names.get(code, [code])))
+    st.markdown("**标的**")
+    st.dataframe(stats.style.format(percent, na_rep="-"), use_container_width=True)
+    st.caption(f"截至 {holdings.as_of:%Y-%m-%d}，共 {holdings.observations} 个交易日；波动率已年化，EWMA 衰减系数 0.94")
+
+SERIAL_SIMULATION_PATHS = 10000  # 不超过该路径数时在当前进程内模拟
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner="正在模拟…")
+def get_simulation(assets_info, categories, years, n_paths, method, threshold, initial):
+    from data_utils.simulation import category_returns, simulate
+    returns = category_returns(assets_info, get_history_prices(assets_info, 5))
+    # 1 万条路径在当前进程内约 1 秒，更多路径时才值得启动进程池
+    return simulate(returns, categories, years=years, n_paths=n_paths, method=method, threshold=threshold,
+                    initial=initial, seed=0, max_workers=1 if n_paths <= SERIAL_SIMULATION_PATHS else None)
+
+def show_category_optimizer(assets_info, temp_cats):
+    """按各小类持仓的历史协方差给出建议比例，采用后写入编辑中的分类配置（仍需点“保存配置”）"""
+    import math
+    import pandas as pd
+    from data_utils.optimizer import BOUNDS, METHODS, RISK_AVERSION, optimize
+    from data_utils.risk import sub_class_risk
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        method = st.radio("优化目标", list(METHODS), format_func=METHODS.get, key="opt_method")
+        years = st.radio("样本区间", [1, 3, 5], index=1, horizontal=True, format_func=lambda y: f"近{y}年", key="opt_years")
+    with col2:
+        lower, upper = st.slider("单个小类比例范围", 0.0, 1.0, BOUNDS, 0.01, format="%.2f", key="opt_bounds")
+    with col3:
+        risk_aversion = st.number_input("风险厌恶系数", min_value=0.5, max_value=50.0, value=RISK_AVERSION, step=0.5,
+                                        key="opt_risk_aversion", disabled=method != "mean_variance")
+    # 建议只对计算时的分类草稿有效：草稿之后又增删改了分类，采用旧建议会丢掉这些修改
+    draft = json.dumps(temp_cats, sort_keys=True, ensure_ascii=False)
+    if st.button("计算建议比例", key="opt_run"):
+        prices = get_history_prices(assets_info, years) if assets_info else None
+        if prices is None or prices.empty:
+            st.info("暂无历史行情，无法计算建议比例")
+            return
+        report = sub_class_risk(assets_info, prices, window=years)
         try:
-            code = info["code"]
-            source = info["type"]
-            amount = info["amount"]
-            if source == "fund":
-                A[name] = get_fund_price_cached(code)
-            elif source == "etf":
-                A[name] = get_price_cached(code)
-        except Exception as e:
-            st.warning(f"获取 {name} 数据失败：{e}")
-
-    # 计算当前价值
-    current_values = {}
-    for name, info in assets_info.items():
-        source = info["type"]
-        amount = info["amount"]
-        if source == "cash":
-            current_values[name] = amount
-        else:
-            if name in A and not A[name].empty:
-                latest_price = A[name]["close"].iloc[-1]
-                current_values[name] = amount * latest_price
-            else:
-                current_values[name] = 0.0
+            st.session_state.category_suggestion = (draft, optimize(
+                temp_cats, report.sample_covariance, method, report.mean_return,
+                bounds=(lower, upper), risk_aversion=risk_aversion,
+            ))
+        except ValueError as e:
+            st.warning(str(e))
+            return
+
+    suggestion_draft, result = st.session_state.get("category_suggestion") or (None, None)
+    if result is None:
+        return
+    if suggestion_draft != draft:
+        st.session_state.category_suggestion = None
+        st.caption("分类配置已修改，请重新计算建议比例")
+        return
+    table = pd.DataFrame({
+        "当前比例": result.previous,
+        "建议比例": result.weights,
+        "风险贡献": result.risk_contribution,
+    }).reindex(result.previous.index)
+    table.index.name = "小类"
+    st.dataframe(table.style.format("{:.2%}", na_rep="-"), use_container_width=True)
+    summary = f"参与优化部分的年化波动率 {result.volatility:.2%}"
+    if not math.isnan(result.expected_return):
+        summary += f"，历史年化收益 {result.expected_return:.2%}"
+    st.caption(summary + "；没有持仓行情的小类和现金保持原比例")
+    if st.button("采用建议比例", key="opt_apply", type="primary"):
+        st.session_state.temp_categories = {
+            name: {**data, "subcategories": dict(data["subcategories"])} for name, data in result.categories.items()
+        }
+        # 比例输入框以 session_state 中的值为准，清掉后才会显示建议比例
+        for key in [k for k in st.session_state if str(k).startswith(("major_ratio_", "minor_ratio_"))]:
+            del st.session_state[key]
+        st.session_state.category_suggestion = None
+        st.rerun()
 
-    # 构建资产明细DataFrame
-    data = []
-    for name, info in assets_info.items():
-        data.append([
-            info["code"],
-            info["type"],
-            info["amount"],
-            info["category"],
-            info.get("remark", "无"),  # 显示备注
-            current_values[name]
-        ])
-    df = pd.DataFrame(data, index=assets_info.keys(),
-                        columns=["代码", "类型", "持有份额", "分类", "备注", "现有价值"])
-    df[["大类", "小类"]] = df["分类"].str.split("-", expand=True)
-
-    # 总资产计算
-    total_value = df["现有价值"].sum()
-
-    # 小类汇总与差额分析
-    sub_summary = df.groupby("分类")["现有价值"].sum()
-    sub_diff = {}
-    sub_diff_ratio = {}
-    for k, tar in target_ratio_sub.items():
-        target_value = total_value * tar
-        actual_value = sub_summary.get(k, 0)
-        sub_diff[k] = actual_value - target_value
-        sub_diff_ratio[k] = sub_diff[k] / target_value * 100 if target_value != 0 else 0
-
-    # 大类汇总与差额分析
-    cls_summary = df.groupby("大类")["现有价值"].sum()
-    cls_diff = {}
-    cls_diff_ratio = {}
-    for k, tar in target_ratio.items():
-        target_value = total_value * tar
-        actual_value = cls_summary.get(k, 0)
-        cls_diff[k] = actual_value - target_value
-        cls_diff_ratio[k] = cls_diff[k] / target_value * 100 if target_value != 0 else 0
-
-    # 结果展示
-    def highlight_diff(row):
-        val = float(row["差额比例"][:-1])
-        if val > 20:
-            return ["background-color: #ff9999;"] * len(row)
-        elif 10 < val <= 20:
-            ratio = (val - 10) / 10
-            r, g, b = 255, int(230 - ratio * 77), int(230 - ratio * 77)
-            return [f"background-color: rgb({r},{g},{b});"] * len(row)
-        elif val < -20:
-            return ["background-color: #99ccff;"] * len(row)
-        elif -20 <= val < -10:
-            ratio = (abs(val) - 10) / 10
-            r, g, b = int(230 - ratio * 77), int(240 - ratio * 36), 255
-            return [f"background-color: rgb({r},{g},{b});"] * len(row)
-        else:
-            return [""] * len(row)
+def show_simulation(assets_info, categories):
+    """按目标配置与阈值调仓规则，用各小类的历史月度收益模拟未来组合价值的分布"""
+    from data_utils.rebalance import REBALANCE_THRESHOLD
+    from data_utils.simulation import METHODS
+    history = get_portfolio_history(assets_info, 5)
+    current = float(history.total.iloc[-1]) if len(history.total) else 100000.0
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        years = st.slider("模拟年数", 1, 30, 20, key="sim_years")
+        initial = st.number_input("初始金额（元）", min_value=1000.0, value=round(max(current, 1000.0), 2), step=1000.0, key="sim_initial")
+    with col2:
+        n_paths = st.select_slider("路径数", [1000, 5000, 10000, 20000], value=10000, key="sim_paths")
+        method = st.radio("抽样方式", list(METHODS), format_func=METHODS.get, key="sim_method")
+    with col3:
+        threshold = st.slider("调仓阈值", 0.05, 0.5, REBALANCE_THRESHOLD, 0.05, format="%.2f", key="sim_threshold")
+    try:
+        result = get_simulation(assets_info, categories, years, n_paths, method, threshold, initial)
+    except ValueError as e:
+        st.info(str(e))
+        return
+    bands = result.bands.rename(columns=lambda p: f"P{p}")
+    bands.index = bands.index / 12
+    st.line_chart(bands, x_label="年", y_label="组合价值（元）")
+    s = result.summary
+    cols = st.columns(4)
+    cols[0].metric("期末中位数", f"{s['p50']:,.0f} 元")
+    cols[1].metric("期末 P5 ~ P95", f"{s['p5'] / 10000:,.1f} ~ {s['p95'] / 10000:,.1f} 万")
+    cols[2].metric("年化收益中位数", f"{s['median_cagr']:.2%}")
+    cols[3].metric("亏损概率", f"{s['loss_probability']:.1%}")
+    st.caption(f"平均每条路径调仓 {s['mean_rebalances']:.1f} 次；每月按阈值检查，现金不参与调仓")
+    if result.dropped:
+        st.caption(f"以下小类没有历史行情，未参与模拟（其余小类按比例放大）：{'、'.join(result.dropped)}")
+
+def show_threshold_sweep(assets_info, categories):
+    """调仓阈值回测：以当前持仓为起点，按当前目标配置回放调仓规则"""
+    from data_utils.backtest import CHECK_FREQUENCIES
+    from data_utils.rebalance import REBALANCE_THRESHOLD
+    col_years, col_fee = st.columns(2)
+    with col_years:
+        years = st.radio("回测区间", [1, 3, 5], index=2, horizontal=True, format_func=lambda y: f"近{y}年", key="sweep_years")
+    with col_fee:
+        fee_bp = st.number_input("交易费率（万分之）", min_value=0.0, max_value=100.0, value=5.0, step=0.5, key="sweep_fee")
+    table = get_threshold_sweep(assets_info, categories, years, fee_bp / 10000)
+    if table.empty:
+        st.info("暂无历史行情")
+        return
+    shown = table.assign(检查频率=table["检查频率"].map(CHECK_FREQUENCIES))
+    st.dataframe(
+        shown.style.format({
+            "阈值": "{:.0%}", "期末价值": "{:,.2f}", "总收益率": "{:.2%}",
+            "年化换手率": "{:.1%}", "跟踪误差": "{:.2%}", "手续费": "{:,.2f}",
+        }),
+        hide_index=True, use_container_width=True,
+    )
+    st.caption(
+        f"当前规则：阈值 {REBALANCE_THRESHOLD:.0%}，每次计算时检查。"
+        "跟踪误差为各小类权重与目标之差的平方和开方（按日平均），年化换手率为成交金额 / 平均组合价值 / 年数"
+    )
 
-    st.markdown(f"### 投资组合总价值：{total_value:,.2f} 元")
+def show_history(assets_info):
+    """组合价值与大类占比的历史走势"""
+    years = st.radio("区间", [1, 3, 5], index=2, horizontal=True, format_func=lambda y: f"近{y}年", key="history_years")
+    history = get_portfolio_history(assets_info, years)
+    if history.total.empty:
+        st.info("暂无历史行情")
+        return
+    st.line_chart(history.total, y_label="组合价值（元）")
+    st.area_chart(history.cls_weights, y_label="大类占比")
+    missing = int(history.missing.iloc[-1])
+    if missing:
+        st.caption(f"有 {missing} 个标的缺少历史行情，按 0 计入")
+
+def show_provider_stats():
+    """行情数据源的健康状况（进程累计）：调用/失败次数、耗时分位数、对冲与故障切换次数"""
+    import pandas as pd
+    from data_utils.providers import provider_stats
+    registries = provider_stats()
+    if not any(p["calls"] for registry in registries for p in registry["providers"]):
+        st.caption("本进程尚未请求行情数据")
+        return
+    rows = [
+        {
+            "数据": registry["registry"],
+            "数据源": p["provider"],
+            "调用": p["calls"],
+            "失败": p["failures"],
+            "近期失败率": f"{p['error_rate']:.0%}",
+            "耗时p50(ms)": "-" if p["p50_ms"] is None else f"{p['p50_ms']:.0f}",
+            "耗时p95(ms)": "-" if p["p95_ms"] is None else f"{p['p95_ms']:.0f}",
+            "最近错误": p["last_error"] or "",
+        }
+        for registry in registries for p in registry["providers"]
+    ]
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    st.caption("；".join(
+        f"{r['registry']}：对冲 {r['hedged']} 次（对冲请求先返回 {r['hedge_wins']} 次），故障切换 {r['failovers']} 次"
+        for r in registries
+    ))
+
+def render_portfolio(snapshot):
+    """渲染组合快照（只负责展示，不做计算）"""
+    df = snapshot.holdings
+    st.markdown(f"### 投资组合总价值：{snapshot.total_value:,.2f} 元")
 
     # 小类目标对比
     st.subheader("各小类目标对比")
-    data_sub = []
-    for k in target_ratio_sub:
-        target_ratio_temp = round(target_ratio_sub[k] * 100, 2)
-        current_ratio_temp = round(sub_summary.get(k, 0) / total_value * 100, 2)
-        current_amount_temp = round(sub_summary.get(k, 0), 2)
-        target_amount_temp = round(total_value * target_ratio_sub[k], 2)
-        diff_ratio_temp = round(sub_diff_ratio[k], 2)
-        diff_amount_temp = round(sub_diff[k], 2)
-        data_sub.append({
-            "现有金额": f"{current_amount_temp:.2f}",
-            "当前比例": f"{current_ratio_temp:.2f}%",
-            "目标金额": f"{target_amount_temp:.2f}",
-            "目标比例": f"{target_ratio_temp:.2f}%",
-            "差额金额": f"{diff_amount_temp:.2f}",
-            "差额比例": f"{diff_ratio_temp:.2f}%"
-        })
-    sub_table = pd.DataFrame(data_sub, index=target_ratio_sub.keys())
-    sub_table.index.name = "小类"
-    st.table(sub_table.style.apply(highlight_diff, axis=1))
+    st.table(format_compare_table(snapshot.sub_table).style.apply(highlight_diff, axis=1))
 
     # 大类目标对比
     st.subheader("各大类目标对比")
-    cls_data = []
-    for k in target_ratio:
-        target_ratio_temp = round(target_ratio[k] * 100, 2)
-        current_ratio_temp = round(cls_summary.get(k, 0) / total_value * 100, 2)
-        current_amount_temp = round(cls_summary.get(k, 0), 2)
-        target_amount_temp = round(total_value * target_ratio[k], 2)
-        diff_ratio_temp = round(cls_diff_ratio[k], 2)
-        diff_amount_temp = round(cls_diff[k], 2)
-        cls_data.append({
-            "现有金额": f"{current_amount_temp:.2f}",
-            "当前比例": f"{current_ratio_temp:.2f}%",
-            "目标金额": f"{target_amount_temp:.2f}",
-            "目标比例": f"{target_ratio_temp:.2f}%",
-            "差额金额": f"{diff_amount_temp:.2f}",
-            "差额比例": f"{diff_ratio_temp:.2f}%"
-        })
-    cls_table = pd.DataFrame(cls_data, index=target_ratio.keys())
-    cls_table.index.name = "大类"
-    st.table(cls_table.style.apply(highlight_diff, axis=1))
+    st.table(format_compare_table(snapshot.cls_table).style.apply(highlight_diff, axis=1))
 
     # 资产明细
     st.divider()
@@ -463,60 +670,34 @@ def calculate_portfolio():
     st.markdown("---")
     st.subheader("📊 调仓建议（再平衡，阈值20%）")
 
-    if df.empty or not target_ratio_sub:
+    if df.empty or not snapshot.target_ratio_sub:
         st.info("请先添加标的并设置目标配置比例，以生成调仓建议")
     else:
-        total_value = df["现有价值"].sum()
-        if total_value == 0:
+        if snapshot.total_value == 0:
             st.warning("所有标的现有价值为0，无法计算调仓建议")
         else:
-            # 1. 计算当前比例（基于现有价值）和目标偏差
-            category_value = df.groupby("分类")["现有价值"].sum().to_dict()
-            current_ratio = {k: v / total_value for k, v in category_value.items()}
-            
-            adjustment = {}
-            for category in target_ratio_sub:
-                if category == "机动-现金":
-                    continue
-                target = target_ratio_sub[category]
-                current = current_ratio.get(category, 0.0)
-                diff_ratio = target - current  # 比例偏差（正数需增持，负数需减持）
-                diff_value = total_value * diff_ratio  # 价值偏差（元）
-                
-                # 计算偏差百分比（过滤<20%的调整，阈值改为20%）
-                deviation_pct = abs(diff_ratio) / target if target > 0 else 1.0
-                adjustment[category] = {
-                    "目标比例": target,
-                    "当前比例": current,
-                    "比例偏差": diff_ratio,
-                    "价值偏差": diff_value,
-                    "偏差百分比": deviation_pct
-                }
-            
-            # 过滤偏差<20%的分类（只保留需要调仓的）
-            significant_adj = {
-                k: v for k, v in adjustment.items() 
-                if v["偏差百分比"] >= 0.2 and v.get("类型") != "cash"  # 增加排除cash的条件
-            }
-            
-            if not significant_adj:
+            # 各小类偏差与各标的调整份额已在快照中算好（偏差<20%的小类不调仓，现金不参与）
+            order_table = snapshot.orders
+            significant_adj = snapshot.rebalance[snapshot.rebalance["需调仓"]]
+
+            if significant_adj.empty:
                 st.success("所有资产类别偏差均小于20%，当前配置合理，无需调仓")
             else:
                 # 2. 大类偏离度展示
                 st.markdown("### 大类资产偏离度（偏差≥20%）")
-                major_deviation = {}
-                for category, adj in significant_adj.items():
-                    major = category.split("-")[0]
-                    major_deviation[major] = major_deviation.get(major, 0.0) + adj["偏差百分比"]
-                
+                major_deviation = significant_adj.groupby(
+                    significant_adj.index.str.split("-").str[0], sort=False
+                )["偏差百分比"].sum()
+
                 major_cols = st.columns(len(major_deviation))
                 for i, (major, dev) in enumerate(major_deviation.items()):
                     with major_cols[i]:
                         st.metric(major, f"偏差 {dev:.0%}", "需调仓")
-                
+
                 # 3. 详细调仓建议
                 st.markdown("### 具体调仓操作建议")
-                for category, adj in significant_adj.items():
+                category_counts = df["分类"].value_counts()
+                for category, adj in significant_adj.iterrows():
                     major, minor = category.split("-")
                     with st.expander(f"{major} - {minor}（偏差 {adj['偏差百分比']:.0%}）", expanded=True):
                         # 小类层面数据
@@ -533,84 +714,38 @@ def calculate_portfolio():
                                 st.subheader(f"🔼 增持 {adj['价值偏差']:.2f}元")
                             else:
                                 st.subheader(f"🔽 减持 {abs(adj['价值偏差']):.2f}元")
-                        
-                        # 标的层面建议（优化卖出取整逻辑）
+
+                        # 标的层面建议（场内按100份取整，场外精确到0.01份，减持不超过当前持有）
                         st.write("涉及标的调整（手数）：")
-                        category_assets = df[df["分类"] == category].index.tolist()
-                        if category_assets:
-                            category_total = df.loc[category_assets, "现有价值"].sum()
-                            for asset_name in category_assets:
-                                # 基础信息获取
-                                asset_type = df.loc[asset_name, "类型"]  # etf=场内，fund/cash=场外
-                                current_shares = df.loc[asset_name, "持有份额"]  # 当前持有份额
-                                unit_value = df.loc[asset_name, "现有价值"] / current_shares if current_shares > 0 else 1.0  # 单位净值
-                                
-                                # 计算单个标的需调整的价值（按比例分摊）
-                                asset_value_ratio = df.loc[asset_name, "现有价值"] / category_total
-                                asset_adjust_value = adj["价值偏差"] * asset_value_ratio
-                                
-                                # 计算调整份额（核心优化点）
-                                adjust_shares = 0
-                                shares_info = ""
-                                if unit_value > 0:
-                                    base_shares = asset_adjust_value / unit_value  # 理论基础份额
-                                    
-                                    # 区分场内/场外 + 增持/减持，优化取整逻辑
-                                    if asset_type == "etf":  # 场内标的（100份整数倍）
-                                        if base_shares > 0:  # 增持
-                                            # 向上取整到100的整数倍（确保达到最低增持需求）
-                                            adjust_shares = (base_shares // 100) * 100
-                                            shares_info = ""
-                                        elif base_shares < 0:  # 减持
-                                            # 向下取整到100的整数倍（不超过预期减持量）
-                                            adjust_shares = (base_shares // 100 + 1) * 100
-                                            # 额外校验：不超过当前持有份额（防止卖空）
-                                            if abs(adjust_shares) > current_shares:
-                                                adjust_shares = -( (current_shares // 100) * 100 )
-                                            shares_info = ""
-                                    elif asset_type == "fund":  # 场外标的（精确到小数点后2位）
-                                        if base_shares > 0:  # 增持
-                                            adjust_shares = round(base_shares, 2)
-                                            shares_info = ""
-                                        elif base_shares < 0:  # 减持
-                                            adjust_shares = round(base_shares, 2)
-                                            # 额外校验：不超过当前持有份额
-                                            if abs(adjust_shares) > current_shares:
-                                                adjust_shares = -round(current_shares, 2)
-                                            shares_info = ""
-                                
-                                # 显示调仓建议
+                        if category_counts.get(category, 0):
+                            for asset_name, order in order_table[order_table["分类"] == category].iterrows():
+                                adjust_shares = order["调整份额"]
+                                unit_value = order["单位净值"]
                                 if adjust_shares > 0:
                                     st.info(
-                                        f"- 「{asset_name}」建议增持 {adjust_shares} 份额 {shares_info}\n"
+                                        f"- 「{asset_name}」建议增持 {adjust_shares} 份额 \n"
                                         f"  对应价值：{adjust_shares * unit_value:.2f}元（单位净值：{unit_value:.2f}元）"
                                     )
-                                elif adjust_shares < 0:
+                                else:
                                     st.warning(
-                                        f"- 「{asset_name}」建议减持 {abs(adjust_shares)} 份额 {shares_info}\n"
-                                        f"  对应价值：{abs(adjust_shares) * unit_value:.2f}元（当前持有：{current_shares:.2f}份）"
+                                        f"- 「{asset_name}」建议减持 {abs(adjust_shares)} 份额 \n"
+                                        f"  对应价值：{abs(adjust_shares) * unit_value:.2f}元（当前持有：{order['持有份额']:.2f}份）"
                                     )
                         else:
                             st.info(f"- 该小类暂无标的，建议新增符合「{minor}」分类的标的")
 
     # 资产分布图表
+    sub_summary, cls_summary = snapshot.sub_summary, snapshot.cls_summary
     st.subheader("小类资产分布")
-    fig1, ax1 = plt.subplots(figsize=(8, 6))
-    ax1.pie(sub_summary.values, labels=sub_summary.index, autopct="%1.1f%%", startangle=90)
-    ax1.axis("equal")
-    st.pyplot(fig1)
+    render_pie(sub_summary)
 
     st.subheader("大类资产分布")
-    fig2, ax2 = plt.subplots(figsize=(8, 6))
-    ax2.pie(cls_summary.values, labels=cls_summary.index, autopct="%1.1f%%", startangle=90)
-    ax2.axis("equal")
-    st.pyplot(fig2)
+    render_pie(cls_summary)
     from datetime import datetime, timedelta
 
     # UTC时间+8小时=北京时间
     beijing_time = datetime.now()
     st.caption(f"更新时间：{beijing_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    return assets_info, categories, target_ratio, target_ratio_sub
 
 # ========== 未登录状态 ==========
 if not st.session_state.logged_in:
@@ -642,8 +777,7 @@ else:
     
     # ========== 一键登录管理（封装为下拉按钮） ==========
     with st.expander("🔗 一键登录管理", expanded=False):  # expanded=False 默认折叠
-        current_user = users_collection.find_one({"username": st.session_state.current_username})
-        current_token = current_user.get("login_token", "")
+        current_token = get_user_doc().get("login_token", "")
         
         if current_token:
             # 显示当前登录URL
@@ -665,6 +799,8 @@ else:
                         {"username": st.session_state.current_username},
                         {"$set": {"login_token": "", "token_expire": 0}}
                     )
+                    remember_user_fields(st.session_state.current_username, login_token="", token_expire=0)
+                    token_cache.invalidate_user(st.session_state.current_username)
                     st.success("一键登录已禁用")
                     st.rerun()
         else:
@@ -675,19 +811,35 @@ else:
                 st.success(f"URL已生成：{login_url}")
                 st.rerun()
 
-    # 点击按钮时调用封装的计算函数
-    if st.button("重新计算资产组合", use_container_width=True, type="primary"):
-        assets_info, categories = get_user_config_from_db()
-        if assets_info:  # 当assets_info是空字典时触发
-            assets_info, categories, target_ratio, target_ratio_sub = calculate_portfolio()
-        else:
-            st.markdown("请先添加新标的！")
-    st.markdown("---")
+    from data_utils.portfolio import flatten_categories
 
     assets_info, categories = get_user_config_from_db()
     target_ratio, target_ratio_sub = flatten_categories(categories)
+
+    # 点击按钮本身就会触发重跑，下方统一计算一次即可
+    col_calc, col_live = st.columns([5, 1])
+    with col_calc:
+        if st.button("重新计算资产组合", use_container_width=True, type="primary"):
+            if not assets_info:  # 当assets_info是空字典时触发
+                st.markdown("请先添加新标的！")
+    with col_live:
+        st.toggle("实时模式", key="live_mode", help="交易时段内自动刷新估值与调仓建议，休市时暂停")
+    st.markdown("---")
+
     if assets_info:  # 当assets_info不是空字典时触发
-        assets_info, categories, target_ratio, target_ratio_sub = calculate_portfolio()
+        assets_info, categories, target_ratio, target_ratio_sub = calculate_portfolio(assets_info, categories)
+        with st.expander("📈 历史走势（按当前持仓份额回溯）", expanded=False):
+            if st.toggle("加载历史走势", key="show_history", help="首次加载需读取全部持仓的历史日线，之后使用本地缓存"):
+                show_history(assets_info)
+        with st.expander("📉 风险指标", expanded=False):
+            if st.toggle("计算风险指标", key="show_risk", help="波动率、最大回撤与相关系数，基于历史日线"):
+                show_risk(assets_info)
+        with st.expander("🎲 蒙特卡洛模拟", expanded=False):
+            if st.toggle("运行模拟", key="show_simulation", help="按目标配置和调仓阈值模拟上万条未来路径"):
+                show_simulation(assets_info, categories)
+        with st.expander("🧪 调仓阈值回测", expanded=False):
+            if st.toggle("运行回测", key="show_sweep", help="按历史行情回放调仓规则，比较不同阈值与检查频率"):
+                show_threshold_sweep(assets_info, categories)
 
 
         # ========== 显示当前持有的标的（更新备注展示） ==========
@@ -878,17 +1030,8 @@ else:
                 )
             
             if submit_edit:
-                # 处理名称变更（需要删除旧键值）
-                if original_name != new_name:
-                    # 1. 先删除原始名称的记录
-                    delete_asset_from_db(original_name)
-                    # 2. 重新获取当前资产（因为已经删除了旧记录）
-                    current_assets, _ = get_user_config_from_db()
-                else:
-                    current_assets, _ = get_user_config_from_db()
-                
                 # 构建更新数据
-                updated_asset = {
+                changes = {
                     new_name: {
                         "code": new_code,
                         "type": new_type,
@@ -897,21 +1040,14 @@ else:
                         "category": new_category
                     }
                 }
+                # 名称变更时在同一次更新中删除旧键值
+                if original_name != new_name:
+                    changes[original_name] = None
                 
-                # 合并更新并保存
-                final_assets = {**current_assets,** updated_asset}
-                # 直接调用数据库更新（复用现有逻辑）
-                try:
-                    users_collection.update_one(
-                        {"username": st.session_state.current_username},
-                        {"$set": {"assets_info": final_assets}}
-                    )
-                    st.success("标的信息更新成功！")
+                if update_asset_in_db(changes):
                     st.session_state.show_edit = False
                     st.session_state.edit_asset = None
                     st.rerun()
-                except Exception as e:
-                    st.error(f"更新失败：{str(e)}")
             
             if cancel_edit:
                 st.session_state.show_edit = False
@@ -951,6 +1087,8 @@ else:
                 st.session_state.asset_to_delete = ""
                 st.rerun()
 
+    remember_holdings_version()
+
 
     # ========== 分类配置功能（核心修改） ==========
     st.markdown("---")
@@ -1004,6 +1142,9 @@ else:
             else:
                 st.error("该大类名称已存在")
 
+        with st.expander("🧮 比例优化建议", expanded=False):
+            show_category_optimizer(assets_info, temp_cats)
+
         # 编辑现有大类和小类
         st.markdown("### 编辑现有分类")
         for major_name in list(temp_cats.keys()):  # 用list避免迭代中修改报错
@@ -1021,8 +1162,8 @@ else:
             with col2:
                 new_major_ratio = st.number_input(
                     "大类比例",
-                    min_value=0.01,
-                    max_value=0.99,
+                    min_value=0.0,  # 采用优化建议时某个大类可能接近 0 或 100%；为 0 时保存会被拒绝
+                    max_value=1.0,
                     value=major_data["ratio"],
                     step=0.01,
                     format="%.2f",
@@ -1136,10 +1277,17 @@ else:
                             st.metric(
                                 minor_name,
                                 f"{minor_ratio:.0%}",
-                                f"占大类比例：{minor_ratio/major_data['ratio']:.0%}"
+                                f"占大类比例：{minor_ratio / major_data['ratio']:.0%}" if major_data["ratio"] else "占大类比例：—"
                             )
 
 
+    st.caption(
+        f"本次运行：数据库往返 {run_metrics.get('db.round_trips')} 次，"
+        f"行情请求 {run_metrics.get('provider.calls')} 次"
+    )
+    with st.expander("📡 数据源状态", expanded=False):
+        show_provider_stats()
+
     # 退出登录按钮
     st.markdown("---")
     if st.button("退出登录", use_container_width=True, type="primary"):